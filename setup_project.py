@@ -15,7 +15,7 @@
 ############ --------------------------------------------------------------- ############
 
 import argparse
-import shutil
+import atexit
 
 from template_user.resources.utils import *
 
@@ -27,7 +27,8 @@ RESOURCES_FILE = f'{d}/template_user/resources/resources.yml'
 def main(repo_dir=None,
          dry_run=True,
          resources=None,
-         output_resources='template_user/resources/resources.yml'):
+         output_resources='template_user/resources/resources.yml',
+         copy_jobs=None):
     """
     Generate resources.yml with path_map and user list.
     Copies template_user dir for each user.
@@ -44,6 +45,8 @@ def main(repo_dir=None,
     output_resources : str | Path | None
         Path to write the generated resources.yml. Defaults to
         'template_user/resources/resources.yml'.
+    copy_jobs : int | None
+        Number of threads used to copy each user directory.
     """
     if not resources: resources = RESOURCES_FILE
 
@@ -66,7 +69,7 @@ def main(repo_dir=None,
     safe_run("rm -rf .git", dry_run=dry_run)
     safe_run(f"mv ../project_template ../{proj_name}", dry_run=dry_run)
 
-    path_map = generate_path_map(m['setup_settings'], proj_name)
+    user_index, path_map = generate_user_index(m['setup_settings'], proj_name)
 
     # also add a users list
     users_list = {'users': list(m['setup_settings']['users'].keys())}
@@ -75,21 +78,22 @@ def main(repo_dir=None,
     if dry_run:
         # return the generated data for testing
         print(f"[DRY-RUN] Would append YAML to {output_resources}")
-        dry_run_outputs = {'path_map': path_map, 'users': users_list['users']}
+        dry_run_outputs = {'path_map': path_map,
+                           'user_index': user_index,
+                           'users': users_list['users']}
 
     else:
-        with Path(output_resources).open('a') as f:
+        with metrics.step('write resources.yml'), Path(output_resources).open('a') as f:
             f.write('\n')
-            yaml.dump({'path_map': path_map}, f, default_flow_style=False)
-            yaml.dump(users_list, f, default_flow_style=False)
+            dump_yml({'path_map': path_map}, f, default_flow_style=False)
+            dump_yml({'user_index': user_index}, f, default_flow_style=False)
+            dump_yml(users_list, f, default_flow_style=False)
 
     # copy template_user for each user
     for user_alias in m['setup_settings']['users']:
         dest = Path(user_alias)
-        if dry_run:
-            print(f"[DRY-RUN] Would copy template_user -> {dest}")
-        else:
-            shutil.copytree("template_user", dest)
+        with metrics.step('copy user dir'):
+            copy_tree("template_user", dest, jobs=copy_jobs, dry_run=dry_run)
 
     if dry_run: return dry_run_outputs
     else: return None
@@ -112,8 +116,24 @@ if __name__ == "__main__":
         help="Path to write updated resources.yml"
     )
 
+    parser.add_argument(
+        "--copy-jobs", type=int, default=None,
+        help="Number of threads used to copy each user directory"
+    )
+
+    parser.add_argument(
+        "--metrics", type=str, default=None,
+        help="Write call counts, timings and bytes read/written of each step to this file "
+             "(Prometheus text format if it ends in .prom, JSON otherwise)"
+    )
+
     args = parser.parse_args()
 
+    if args.metrics:
+        metrics.enabled = True
+        atexit.register(metrics.write, args.metrics)
+
     main(dry_run=args.dry_run,
          resources=args.resources,
-         output_resources=args.output_resources)
+         output_resources=args.output_resources,
+         copy_jobs=args.copy_jobs)
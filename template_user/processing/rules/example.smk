@@ -1,4 +1,6 @@
 rule example_rule1:
+    params:
+        slurm_log = log_layout.slurm_log("example_rule1")
     resources:
         runtime = 60,
         threads = 112
@@ -9,6 +11,8 @@ rule example_rule1:
         """
 
 rule example_rule2:
+    params:
+        slurm_log = log_layout.slurm_log("example_rule2")
     resources:
         runtime = 60,
         threads = 112
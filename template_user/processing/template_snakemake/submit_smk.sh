@@ -16,6 +16,18 @@ module load miniconda && source activate sqanti3-snakemake
 
 PARAM="$1"
 
+# Slurm logs go to smk_logs/<rule>/<shard>/ (see LogLayout in resources/smk_utils.py);
+# rules can set it with `params: slurm_log = log_layout.slurm_log("<rule>")`, the
+# Snakefile gives one to the rules that don't (log_layout.add_slurm_logs at its end).
+# sbatch doesn't create the directory of -o, so it is created for each submitted
+# job here; dry runs (-n, --dag) submit nothing and create nothing
+CLUSTER="mkdir -p \$(dirname {params.slurm_log}) && sbatch \
+  -q gp_bscls \
+  -c {resources.threads} \
+  -A bsc83 \
+  -o {params.slurm_log} \
+  -t {resources.runtime}"
+
 case "$PARAM" in
   run)
     snakemake \
@@ -26,12 +38,7 @@ case "$PARAM" in
       --keep-going \
       --latency-wait 120 \
       --rerun-incomplete \
-      --cluster "sbatch \
-        -q gp_bscls \
-        -c {resources.threads} \
-        -A bsc83 \
-        -o smk_logs/{wildcards.sample}/%j_%x.out \
-        -t {resources.runtime}"
+      --cluster "$CLUSTER"
     ;;
   rerun)
     snakemake --unlock \
@@ -42,12 +49,7 @@ case "$PARAM" in
       --keep-going \
       --latency-wait 120 \
       --rerun-incomplete \
-      --cluster "sbatch \
-        -q gp_bscls \
-        -c {resources.threads} \
-        -A bsc83 \
-        -o smk_out/{wildcards.sample}/%j_%x.out \
-        -t {resources.runtime}"
+      --cluster "$CLUSTER"
     ;;
   dryrun)
     snakemake \
@@ -59,12 +61,7 @@ case "$PARAM" in
       --keep-going \
       --latency-wait 120 \
       --rerun-incomplete \
-      --cluster "sbatch \
-        -q gp_bscls \
-        -c {resources.threads} \
-        -A bsc83 \
-        -o smk_out/{wildcards.sample}/%j_%x.out \
-        -t {resources.runtime}" \
+      --cluster "$CLUSTER" \
       -n
     ;;
   graph)
@@ -77,12 +74,7 @@ case "$PARAM" in
       --keep-going \
       --latency-wait 120 \
       --rerun-incomplete \
-      --cluster "sbatch \
-        -q gp_bscls \
-        -c {resources.threads} \
-        -A bsc83 \
-        -o smk_out/{wildcards.sample}/%j_%x.out \
-        -t {resources.runtime}" \
+      --cluster "$CLUSTER" \
       -n \
       | dot -Tpng > "workflow_dag.png"
     ;;
@@ -1,8 +1,11 @@
 ################################## README BEFORE USAGE ##################################
 
-# USE THIS SCRIPT TO CREATE THE config.yml with the full marenostrum5 paths
+# This script adds links to all the git-tracked files and directories that are
+# mentioned (but not yet linked) in the READMEs. Only READMEs that changed, or
+# whose directory (or, for READMEs with ../ paths, the repo) gained or lost
+# tracked files since the last run, are reprocessed
 
-#     Usage: python3 save_mn5_config.py
+#     Usage: python3 resources/add_links_to_readmes.py [--full] [--jobs N]
 
                                     #   /\_/\
                                     #  ( o.o )
@@ -17,16 +20,16 @@
 import os
 import sys
 from pathlib import Path
-from marko import Markdown
-from marko.md_renderer import MarkdownRenderer
-from marko.inline import RawText, Link, CodeSpan
-from marko.block import FencedCode, CodeBlock
+# marko is only imported when a README needs to be rewritten
 
 import re
+import json
+import hashlib
+import argparse
+from bisect import bisect_left
 
 # Append resources dir to path
-p = os.path.dirname(os.getcwd())+'/resources/'
-sys.path.append(p)
+sys.path.append(str(Path(__file__).resolve().parent))
 
 from utils import *
 
@@ -75,9 +78,9 @@ def extract_parts(s: str):
     return leading, core_trimmed, trailing
 
 
-def format_link(word):
+def format_link(word, is_dir=False):
     """Format link in markdown depending on if it's a directory or a file."""
-    if Path(word).is_dir():
+    if is_dir:
         return f'[{word}]({word})'
     else:
         return f'[`{word}`]({word})'
@@ -85,7 +88,7 @@ def format_link(word):
 
 # ---- main transformer ----
 
-def link_files(node, files):
+def link_files(node, files, md_dir='.'):
     """
     Walk a Markdown AST node and replace unlinked filenames/dirs
     with markdown links to those paths.
@@ -94,14 +97,18 @@ def link_files(node, files):
     ----------
     node : mdit_py_plugins node
         AST node to transform.
-    files : set of str
-        Set of known file/directory paths to link.
+    files : PathIndex
+        Index of known file/directory paths to link.
+    md_dir : str
+        Directory of the Markdown file; paths in it are relative to it.
 
     Returns
     -------
     node : mdit_py_plugins node
         Node with links inserted where appropriate.
     """
+    from marko.inline import RawText, Link, CodeSpan
+    from marko.block import FencedCode, CodeBlock
 
     # skip entire code blocks
     if isinstance(node, (FencedCode, CodeBlock)):
@@ -125,8 +132,9 @@ def link_files(node, files):
             parts = extract_parts(tok)
             if parts:
                 p1, core, p2 = parts
-                if core in files:
-                    replaced = format_link(core)
+                target = files.lookup(core, md_dir)
+                if target is not None:
+                    replaced = format_link(core, files.is_dir(target))
                     new_nodes.append(RawText(p1 + replaced + p2))
                     continue
 
@@ -139,7 +147,7 @@ def link_files(node, files):
     if hasattr(node, "children"):
         new_children = []
         for child in node.children:
-            replaced = link_files(child, files)
+            replaced = link_files(child, files, md_dir)
             if isinstance(replaced, list):
                 new_children.extend(replaced)
             else:
@@ -148,42 +156,183 @@ def link_files(node, files):
 
     return node
 
-# get all git files that are md
-cmd = 'git ls-files'
-files = run_cmd(cmd).splitlines()
-dirs = [str(Path(f).parent) for f in files]
-md_files = [f for f in list(set(files)|set(dirs)) if f != '.' and f.endswith('.md')]
-
-# get all git files
-cmd = 'git ls-files'
-files = run_cmd(cmd).splitlines()
-dirs = [str(Path(f).parent) for f in files]
-files = [f for f in list(set(files)|set(dirs)) if f != '.']
-dirs = [f'{f}/' for f in files if Path(f).is_dir()] # add the trailing / version of dirs
-files += dirs
-
-# loop through all md files to edit
-# md_files = ['README_test.md']
-# md_files = ['TEST_revised.md']
-# md_files = ['analysis/README.md']
-for md_file in md_files:
-    rel_files = []
-    for file in files:
-
-        # compute relative path from md_file's directory
-        rel_path = os.path.relpath(file, Path(md_file).parent)
-        rel_files.append(rel_path)
+# ---- incremental mode ----
+
+# records, for each README, the hash of its last written content and of the
+# tracked paths it can link to (those under its directory, or all of them if
+# it mentions ../ paths), so unchanged READMEs can be skipped. It is local
+# state: gitignored, and kept in the cache by the GitHub action
+MANIFEST_FILE = '.readme_links_manifest.json'
+MANIFEST_VERSION = 2
+
+def hash_text(s):
+    """sha256 hex digest of a string."""
+    return hashlib.sha256(s.encode()).hexdigest()
+
+def load_manifest(file=MANIFEST_FILE):
+    """Load the manifest from the last run; empty if missing or outdated."""
+    try:
+        with open(file) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'version': MANIFEST_VERSION, 'readmes': {}}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'readmes': {}}
+    return manifest
+
+def save_manifest(manifest, file=MANIFEST_FILE):
+    with open(file, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+        f.write('\n')
+
+def subtree_digest(md_dir, sorted_files):
+    """
+    Hash of the tracked paths under `md_dir`.
+
+    Parameters
+    ----------
+    md_dir : str
+        Directory of the README ('.' for the repo root).
+    sorted_files : list of str
+        All tracked files and directories, sorted.
+    """
+    if md_dir in ('', '.'):
+        subtree = sorted_files
+    else:
+        prefix = f'{md_dir}/'
+        # paths under md_dir are contiguous in the sorted list
+        start = bisect_left(sorted_files, prefix)
+        end = bisect_left(sorted_files, prefix[:-1] + chr(ord('/') + 1), lo=start)
+        subtree = sorted_files[start:end]
+    return hash_text('\n'.join(subtree))
+
+def add_links(content, files, md_dir):
+    """Parse a README, link the files it mentions, and render it back."""
+    from marko import Markdown
+    from marko.md_renderer import MarkdownRenderer
 
     md = Markdown()
-    with open(md_file, 'r') as f:
-        content = f.read()
-        doc = md.parse(content)
+    doc = md.parse(content)
 
-    doc = link_files(doc, rel_files)
+    doc = link_files(doc, files, md_dir)
 
     md = Markdown(renderer=MarkdownRenderer)
-    doc = md.render(doc)
+    return md.render(doc)
+
+def list_tracked_files():
+    """
+    Tracked files and directories, and the tracked Markdown files.
+
+    Returns
+    -------
+    index : PathIndex
+        Tracked files and directories.
+    md_files : list of str
+        Tracked Markdown files.
+    """
+    # one git call; directories come from the paths, not the file system
+    index = repo_snapshot(exclude=[MANIFEST_FILE])
+    md_files = [f for f in index.files if f.endswith('.md')]
+
+    return index, md_files
 
-    # write to new md file
-    with open(f'{md_file}', 'w') as ofile:
-        ofile.write(doc)
+# index shared by the worker processes; sent once per worker, not per README
+_worker_index = None
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+def _add_links_worker(args):
+    content, md_dir = args
+    return add_links(content, _worker_index, md_dir)
+
+def main(jobs=None, full=False):
+    """
+    Add links to tracked files and directories in all tracked READMEs.
+
+    Parameters
+    ----------
+    jobs : int | None
+        Number of processes to parse / transform / render READMEs with.
+        If None or 1, READMEs are processed in this process.
+    full : bool
+        If True, reprocess every README, even those that did not change
+        (and whose directory did not change) since the last run.
+
+    Returns
+    -------
+    list of str
+        READMEs that were rewritten.
+    """
+    # built once; lookups relative to each README are constant time
+    index, md_files = list_tracked_files()
+    sorted_files = sorted(index.paths | {f'{d}/' for d in index.dirs})
+
+    manifest = load_manifest()
+    readmes = {}
+    todo = []
+    all_digest = subtree_digest('.', sorted_files)
+
+    # find the md files to edit
+    for md_file in sorted(md_files):
+        md_dir = str(Path(md_file).parent)
+
+        with open(md_file, 'r') as f:
+            content = f.read()
+
+        # ../ paths can point anywhere in the repo, e.g. ../processing/new.py
+        # in analysis/README.md, so those READMEs depend on every tracked path
+        entry = {'content': hash_text(content),
+                 'subtree': all_digest if '../' in content
+                            else subtree_digest(md_dir, sorted_files)}
+        readmes[md_file] = entry
+
+        # nothing changed in the README or in the paths it can link to since last run
+        if not full and manifest['readmes'].get(md_file) == entry:
+            continue
+
+        todo.append((md_file, md_dir, content))
+
+    # parse / transform / render, in parallel if requested
+    tasks = [(content, md_dir) for _, md_dir, content in todo]
+    if jobs and jobs > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 initializer=_init_worker,
+                                 initargs=(index,)) as pool:
+            docs = list(pool.map(_add_links_worker, tasks))
+    else:
+        docs = [add_links(content, index, md_dir) for content, md_dir in tasks]
+
+    # write in a deterministic order, only if something changed
+    written = []
+    for (md_file, _, content), doc in zip(todo, docs):
+        if doc != content:
+            with open(f'{md_file}', 'w') as ofile:
+                ofile.write(doc)
+            written.append(md_file)
+
+        readmes[md_file]['content'] = hash_text(doc)
+
+    # READMEs that are no longer tracked are dropped
+    manifest['readmes'] = readmes
+    save_manifest(manifest)
+
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Add links to tracked files and directories in READMEs"
+    )
+    parser.add_argument(
+        "--full", action="store_true",
+        help="Reprocess every README, even if it and the files under it did not change"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=None,
+        help="Number of processes used to process READMEs"
+    )
+    args = parser.parse_args()
+
+    main(jobs=args.jobs, full=args.full)
@@ -18,19 +18,128 @@
 
 ############ --------------------------------------------------------------- ############
 
-from pyprojroot.here import here
 import sys
 import argparse
+import atexit
 import shutil
 from pathlib import Path
 
-sys.path = [str(here())]+sys.path
+# user dir (parent of resources/)
+sys.path = [str(Path(__file__).resolve().parents[1])]+sys.path
 
 from resources.utils import *
 
+GIT_MODES = ['copy', 'shared', 'worktree']
+
+def setup_new_user_dir(curr_user_dir,
+                       new_user_dir,
+                       head,
+                       git_mode='copy',
+                       origin_url=None,
+                       dry_run=True,
+                       copy_jobs=None,
+                       link=None,
+                       skip_ignored=False):
+    """
+    Create a new user's directory from the current user's directory,
+    checked out at the remote HEAD branch.
+
+    Parameters
+    ----------
+    curr_user_dir : Path
+        Current user's directory (a git repo).
+    new_user_dir : Path
+        Directory to create for the new user.
+    head : str
+        Remote HEAD branch (e.g. 'main').
+    git_mode : {'copy', 'shared', 'worktree'}
+        - 'copy': copy the whole directory, including .git, then fetch
+          origin and reset to origin/<head>.
+        - 'shared': local `git clone` of the current user's repo, which hard
+          links the git objects instead of copying them (on the same file
+          system), and point origin back to the remote. Only origin's
+          branches are kept, not the current user's local ones. Unlike
+          `git clone --shared`, the new repo doesn't depend on the current
+          user's one: `git gc` or deleting it can't corrupt it.
+          Expects origin to be fetched in `curr_user_dir`.
+        - 'worktree': add a `git worktree` of the current user's repo on a
+          new branch named after the new user. The worktree's index, HEAD
+          and commits are stored in the current user's `.git`, so the new
+          user needs write access to it, and the new user's directory
+          breaks if the current user's repo is removed. Expects origin to
+          be fetched in `curr_user_dir`.
+    origin_url : str | None
+        URL of the origin remote; required for 'shared'.
+    dry_run : bool
+        If True, no destructive operations are performed; operations are logged.
+    copy_jobs, link, skip_ignored
+        Passed to copy_tree in 'copy' mode.
+    """
+    if git_mode == 'copy':
+        with metrics.step('copy user dir'):
+            copy_tree(curr_user_dir, new_user_dir,
+                      jobs=copy_jobs,
+                      link=link,
+                      skip_ignored=skip_ignored,
+                      dry_run=dry_run)
+
+        git_cmds = [
+            "git fetch origin",
+            f"git reset --hard origin/{head}",
+            f"git checkout {head}"
+        ]
+        with metrics.step('git setup'):
+            for cmd in git_cmds:
+                safe_run(cmd, dry_run=dry_run, wd=new_user_dir)
+        return
+
+    if git_mode == 'shared':
+        # the clone's origin/* are the current user's local branches, and its
+        # only branch is the one checked out there: both are replaced by
+        # origin's, so the new user never sees the current user's branches
+        git_cmds = [
+            f"git remote set-url origin {origin_url}",
+            # local fetch of the remote-tracking branches; no network, and
+            # the objects are already there through the hard links. --prune
+            # drops the origin/* that are not on origin
+            f"git fetch --prune --no-tags {curr_user_dir} +refs/remotes/origin/*:refs/remotes/origin/*",
+            f"git checkout -B {head} origin/{head}"
+        ]
+        with metrics.step('git setup'):
+            safe_run(f"git clone --no-checkout {curr_user_dir} {new_user_dir}",
+                     dry_run=dry_run, wd=curr_user_dir)
+            cloned = safe_run("git branch --format=%(refname:short)",
+                              dry_run=dry_run, wd=new_user_dir)
+            for cmd in git_cmds:
+                safe_run(cmd, dry_run=dry_run, wd=new_user_dir)
+            for branch in (cloned or '').split():
+                if branch != head:
+                    safe_run(f"git branch -D {branch}", dry_run=dry_run, wd=new_user_dir)
+
+    elif git_mode == 'worktree':
+        with metrics.step('git setup'):
+            safe_run(f"git worktree add -b {new_user_dir.name} {new_user_dir} origin/{head}",
+                     dry_run=dry_run, wd=curr_user_dir)
+
+    else:
+        raise ValueError(f"git_mode must be one of {GIT_MODES}, got {git_mode!r}")
+
+    # only tracked files are checked out; bring over the freshly written resources.yml
+    resources_file = Path('resources/resources.yml')
+    if dry_run:
+        print(f"[DRY-RUN] Would copy {curr_user_dir / resources_file} -> {new_user_dir / resources_file}")
+    elif (curr_user_dir / resources_file).exists():
+        (new_user_dir / resources_file).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(curr_user_dir / resources_file, new_user_dir / resources_file)
+
 def main(dry_run=True,
          user_dir=None,
-         resources=None):
+         resources=None,
+         copy_jobs=None,
+         link=None,
+         skip_ignored=False,
+         git_mode='copy',
+         jobs=None):
     """
     Generate resources.yml with path_map and user list.
     Copies user's dir for each NEW user.
@@ -46,6 +155,21 @@ def main(dry_run=True,
         Path to user's directory
     resources : dict | str | None
         Path to resources.yml or a pre-loaded dict.
+    copy_jobs : int | None
+        Number of threads used to copy the user directory.
+    link : {None, 'hardlink', 'reflink'}
+        Link instead of copying git objects ('hardlink') or all
+        files ('reflink'), see copy_tree.
+    skip_ignored : bool
+        If True, don't copy files ignored by git.
+    git_mode : {'copy', 'shared', 'worktree'}
+        How to create the new users' directories, see setup_new_user_dir.
+        'shared' (hard links) and 'worktree' share the git objects with the
+        current user's repo and fetch from origin only once.
+    jobs : int | None
+        Number of users to process concurrently (resources.yml rewrites and
+        new user directories). Ignored in dry-run mode, so that the output
+        stays ordered. Errors are collected and raised together at the end.
     """
 
     # stuff to return if we're in dry run
@@ -57,7 +181,7 @@ def main(dry_run=True,
     proj_name = m['setup_settings']['project_name']
 
     # if no user dir provided, infer
-    user_dir = Path(user_dir) if user_dir else here()
+    user_dir = Path(user_dir) if user_dir else find_project_root()
     curr_user = user_dir.name
     project_dir = user_dir.parent.resolve()
 
@@ -92,13 +216,18 @@ def main(dry_run=True,
     if head == '(unknown)':
         raise ValueError('No remote git history detected. Please push at least once to remote before adding a user')
 
-    path_map = generate_path_map(m['setup_settings'], proj_name)
+    # only recompute the paths of new users and users whose settings changed
+    user_index, path_map = generate_user_index(m['setup_settings'], proj_name,
+                                               index=m.get('user_index'),
+                                               path_map=m.get('path_map'))
 
     # also add a users list
     users_list = {'users': list(m['setup_settings']['users'].keys())}
 
+    if dry_run: jobs = None
+
     # for each current user, update the resources.yml
-    for user_alias in curr_users:
+    def update_user_resources(user_alias):
 
         # load this users' resources to add the new user to
         temp_user_dir = str(Path(f'{project_dir}/{user_alias}').resolve())
@@ -111,34 +240,47 @@ def main(dry_run=True,
             if dry_run:
                 dry_run_outputs.append({'user_resources': user_resources,
                                         'path_map': path_map,
+                                        'user_index': user_index,
                                         'users': users_list})
         else:
             m = load_yml(user_resources)
             # when writing, we now need to overwrite previous entries
             m['path_map'] = path_map
-            with Path(user_resources).open('w') as f:
-                yaml.dump({'path_map': path_map}, f, default_flow_style=False)
-                yaml.dump(users_list, f, default_flow_style=False)
+            with metrics.step('write resources.yml'), Path(user_resources).open('w') as f:
+                dump_yml({'path_map': path_map}, f, default_flow_style=False)
+                dump_yml({'user_index': user_index}, f, default_flow_style=False)
+                dump_yml(users_list, f, default_flow_style=False)
+
+    errors = run_jobs(update_user_resources, curr_users, jobs=jobs)
+    if errors:
+        raise RuntimeError(format_job_errors(errors, 'update resources.yml'))
+
+    # shared / worktree modes fetch once here, instead of once per new user
+    origin_url = None
+    with metrics.step('git setup'):
+        if git_mode != 'copy':
+            safe_run("git fetch origin", dry_run=dry_run, wd=curr_user_dir)
+        if git_mode == 'shared':
+            origin_url = safe_run("git remote get-url origin", dry_run=dry_run, wd=curr_user_dir)
+            origin_url = '<origin>' if dry_run else origin_url.strip()
 
     # for each new user, copy the user's directory that is carrying out
     # the change, and switch to the main branch
-    for user_alias in new_users:
+    def add_user(user_alias):
         new_user_dir = Path(project_dir) / user_alias
-
-
-        if not dry_run:
-            shutil.copytree(curr_user_dir, new_user_dir)
-        else:
-            print(f"[DRY-RUN] Would copy {curr_user_dir} -> {new_user_dir}")
-
-        git_cmds = [
-            "git fetch origin",
-            f"git reset --hard origin/{head}",
-            f"git checkout {head}"
-        ]
-
-        for cmd in git_cmds:
-            safe_run(cmd, dry_run=dry_run, wd=new_user_dir)
+        setup_new_user_dir(curr_user_dir, new_user_dir, head,
+                           git_mode=git_mode,
+                           origin_url=origin_url,
+                           dry_run=dry_run,
+                           copy_jobs=copy_jobs,
+                           link=link,
+                           skip_ignored=skip_ignored)
+
+    # worktrees all write to the current user's repo; add them one at a time
+    errors = run_jobs(add_user, new_users,
+                      jobs=None if git_mode == 'worktree' else jobs)
+    if errors:
+        raise RuntimeError(format_job_errors(errors, 'add new user directories'))
 
     if dry_run: return dry_run_outputs
 
@@ -159,8 +301,51 @@ if __name__ == "__main__":
         help="User's directory to copy for new users"
     )
 
+    parser.add_argument(
+        "--copy-jobs", type=int, default=None,
+        help="Number of threads used to copy the user directory"
+    )
+    parser.add_argument(
+        "--link", choices=["hardlink", "reflink"], default=None,
+        help="Hard link git objects, or reflink (copy-on-write) all files, instead of copying"
+    )
+    parser.add_argument(
+        "--skip-ignored", action="store_true",
+        help="Don't copy files ignored by git"
+    )
+
+    parser.add_argument(
+        "--git-mode", choices=GIT_MODES, default="copy",
+        help="How to create new user directories: copy the whole directory (default); "
+             "'shared': local clone that hard links the git objects of your repo "
+             "(same file system; independent of your repo afterwards); "
+             "'worktree': git worktree of your repo, which stores the new users' index "
+             "and commits in your .git (new users need write access to it, and lose "
+             "their repo if yours is removed)"
+    )
+
+    parser.add_argument(
+        "--jobs", type=int, default=None,
+        help="Number of users to process concurrently"
+    )
+
+    parser.add_argument(
+        "--metrics", type=str, default=None,
+        help="Write call counts, timings and bytes read/written of each step to this file "
+             "(Prometheus text format if it ends in .prom, JSON otherwise)"
+    )
+
     args = parser.parse_args()
 
+    if args.metrics:
+        metrics.enabled = True
+        atexit.register(metrics.write, args.metrics)
+
     main(dry_run=args.dry_run,
          resources=args.resources,
-         user_dir=args.user_dir)
+         user_dir=args.user_dir,
+         copy_jobs=args.copy_jobs,
+         link=args.link,
+         skip_ignored=args.skip_ignored,
+         git_mode=args.git_mode,
+         jobs=args.jobs)
@@ -3,7 +3,7 @@
 # This script adds the subfolders as bullet point links to the READMEs
 # of analysis/ and processing/ if they don't already exist
 
-#     Usage: python3 add_subfolders_to_readmes.py
+#     Usage: python3 resources/add_subfolders_to_readmes.py [--jobs N]
 
                                     #   /\_/\
                                     #  ( o.o )
@@ -16,8 +16,14 @@
 ############ --------------------------------------------------------------- ############
 
 import os
+import re
 import sys
+import argparse
 from pathlib import Path
+from functools import partial
+
+# Append resources dir to path
+sys.path.append(str(Path(__file__).resolve().parent))
 
 from utils import *
 
@@ -33,59 +39,174 @@ README_HEADERS = {
     'analysis': '## Subfolder descriptions'  # adjust if different
 }
 
-all_missing_dirs = []
-
-for d, perm_dirs in PERMANENT_DIRS.items():
-    readme = f'{d}/README.md'
+# anything written in square brackets, e.g. the name in '* [name](name/)'
+_NAME_RE = re.compile(r'\[([^\[\]]*)\]')
+
+def mentioned_names(lines):
+    """
+    Names written in square brackets anywhere in a README.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Lines of the README.
+
+    Returns
+    -------
+    set of str
+    """
+    return {name for line in lines for name in _NAME_RE.findall(line)}
+
+def find_missing_subdirs(d, perm_dirs, index, mentioned):
+    """
+    Subdirectories of `d` that are not mentioned in its README yet.
+
+    Parameters
+    ----------
+    d : str
+        Directory whose README to check (e.g. 'analysis').
+    perm_dirs : list of str
+        Subdirectories to ignore.
+    index : PathIndex
+        Tracked files and directories (see utils.repo_snapshot).
+    mentioned : set of str
+        Names already in the README (see mentioned_names).
+
+    Returns
+    -------
+    list of Path
+    """
+    # tracked subdirs, straight from the index (no stat calls)
+    sub_ds = sorted(p for p in index.dirs if os.path.dirname(p) == d)
 
     # Find missing subdirs
     to_update = []
-    for sub_d in Path(d).glob('*/'):
+    for sub_d in map(Path, sub_ds):
         stem_sub_d = sub_d.stem
-        if stem_sub_d in perm_dirs or not sub_d.is_dir():
-            continue
-        fmt_sub_d = f'[{stem_sub_d}]'
-        if any(fmt_sub_d in line for line in open(readme)):
+        if stem_sub_d in perm_dirs or stem_sub_d in mentioned:
             continue
         to_update.append(sub_d)
 
-    # Add missing subdirs to README
-    if to_update:
-        m = load_resources()  # get repo URL, etc.
-        header = README_HEADERS[d]
+    return to_update
+
+def add_subfolder_bullets(lines, header, to_update):
+    """
+    Insert a bullet for each subfolder in `to_update` after the last bullet
+    of the `header` section (or at the end of the section if it has no
+    bullets, or at the end of the file if there is no such section).
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Lines of the README.
+    header : str
+        Header of the section the bullets go in.
+    to_update : list of Path
+        Subfolders to add.
+
+    Returns
+    -------
+    list of str
+        Lines of the updated README.
+    """
+    new_lines = [f"* [{sub_d.stem}]({sub_d.stem}/): # TODO!!\n" for sub_d in to_update]
+
+    # single pass; lines of the section after its last bullet are held
+    # back until we know whether another bullet follows
+    output_lines = []
+    held = []
+    inside_section = False
+    seen_bullet = False
+    inserted = False
+
+    for line in lines:
+        if inside_section:
+            if line.startswith("## "):
+                output_lines.extend(new_lines)
+                output_lines.extend(held)
+                inside_section = False
+                inserted = True
+            elif "* [" in line:
+                output_lines.extend(held)
+                output_lines.append(line)
+                held = []
+                seen_bullet = True
+                continue
+            elif seen_bullet:
+                held.append(line)
+                continue
+            else:
+                output_lines.append(line)
+                continue
+
+        output_lines.append(line)
 
-        with open(readme, 'r') as infile:
-            lines = infile.readlines()
+        if not inserted and header in line:
+            inside_section = True
 
-        output_lines = []
-        inside_section = False
-        inserted = False
+    # section runs to the end of the file
+    if inside_section:
+        output_lines.extend(new_lines)
+        output_lines.extend(held)
+    elif not inserted:
+        output_lines.extend(new_lines)
 
-        for i, line in enumerate(lines):
-            output_lines.append(line)
+    return output_lines
 
-            if header in line:
-                inside_section = True
-                continue
+def update_readme(d, index):
+    """
+    Compute the updated README of `d`, given the tracked paths in `index`.
 
-            if inside_section and line.startswith("## "):
-                last_bullet_idx = max(
-                    (i for i, line in enumerate(output_lines) if "* [" in line.strip()),
-                    default=i-1
-                )
-                for j, sub_d in enumerate(to_update):
-                    stem_sub_d = sub_d.stem
-                    output_lines.insert(
-                        last_bullet_idx + j + 1,
-                        f"* [{stem_sub_d}]({stem_sub_d}/): # TODO!!\n"
-                    )
-                inside_section = False
-                inserted = True
+    Returns
+    -------
+    tuple
+        (path to README, missing subfolders, updated lines or None if
+        nothing is missing)
+    """
+    readme = f'{d}/README.md'
 
-        if not inserted:
-            for sub_d in to_update:
-                stem_sub_d = sub_d.stem
-                output_lines.append(f"* [{stem_sub_d}]({stem_sub_d}/): # TODO!!\n")
+    # read once; both the check and the edit work on these lines
+    with open(readme, 'r') as infile:
+        lines = infile.readlines()
+
+    to_update = find_missing_subdirs(d, PERMANENT_DIRS[d], index, mentioned_names(lines))
+    if not to_update:
+        return readme, to_update, None
+
+    return readme, to_update, add_subfolder_bullets(lines, README_HEADERS[d], to_update)
+
+def main(jobs=None):
+    """
+    Add the missing subfolders as bullet points to the READMEs
+    of analysis/ and processing/.
+
+    Parameters
+    ----------
+    jobs : int | None
+        Number of processes used to compute the updated READMEs.
+        If None or 1, READMEs are processed in this process.
+
+    Returns
+    -------
+    list of Path
+        All subfolders that were added.
+    """
+    # one git call for the whole repo
+    update = partial(update_readme, index=repo_snapshot())
+
+    dirs = list(PERMANENT_DIRS)
+    if jobs and jobs > 1 and len(dirs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(update, dirs))
+    else:
+        results = [update(d) for d in dirs]
+
+    # write in a deterministic order
+    all_missing_dirs = []
+    for readme, to_update, output_lines in results:
+        if output_lines is None:
+            continue
 
         with open(readme, 'w') as outfile:
             outfile.writelines(output_lines)
@@ -94,3 +215,17 @@ for d, perm_dirs in PERMANENT_DIRS.items():
         for sub_d in to_update:
             print(f"- {sub_d.stem}")
         all_missing_dirs.extend(to_update)
+
+    return all_missing_dirs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Add subfolders as bullet points to the analysis/ and processing/ READMEs"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=None,
+        help="Number of processes used to process READMEs"
+    )
+    args = parser.parse_args()
+
+    main(jobs=args.jobs)
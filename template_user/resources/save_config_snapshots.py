@@ -0,0 +1,26 @@
+################################## README BEFORE USAGE ##################################
+
+# USE THIS SCRIPT TO PRE-BUILD THE BINARY SNAPSHOTS OF THE RESOLVED config.yml
+# (one per user in resources.yml), so that load_config can skip YAML parsing
+# and path resolution at startup. Run it on the system you will use them on.
+
+#     Usage: python3 save_config_snapshots.py
+
+                                    #   /\_/\
+                                    #  ( o.o )
+                                    #   > ^ <
+                                    #  /     \
+                                    # (       )
+                                    #  \__ __/
+                                    #   || ||
+
+############ --------------------------------------------------------------- ############
+
+import os
+import sys
+
+from utils import *
+
+# Call function from utils.py
+for f in save_config_snapshots():
+    print(f"Saved {f}")
@@ -12,7 +12,258 @@
                                     #   || ||
 
 ############ --------------------------------------------------------------- ############
-import pandas as pd
+import os
+import re
+import sys
+import time
+import hashlib
+from contextlib import contextmanager
+# numpy and pandas are imported in the functions that use them, so that
+# the log and rule-module helpers don't load them in every job
+
+# formats the metadata can be cached in, next to the TSV (need pyarrow)
+METADATA_CACHE_FORMATS = ('parquet', 'feather')
+
+def _memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+def to_categorical(df, max_unique_frac=0.5):
+    """
+    Convert low-cardinality string columns of a DataFrame to `category`.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame to convert (modified in place).
+    max_unique_frac : float, optional (default=0.5)
+        Columns with at most this fraction of unique values are converted.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The converted DataFrame.
+    """
+    import pandas as pd
+    for column in df.columns:
+        col = df[column]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            continue
+        if not (pd.api.types.is_object_dtype(col) or pd.api.types.is_string_dtype(col)):
+            continue
+        if len(col) and col.nunique() <= max_unique_frac * len(col):
+            df[column] = col.astype('category')
+    return df
+
+# key of the DataFrame.attrs entry recording how a cached table was built
+_CACHE_SETTINGS = 'metadata_cache'
+
+def _cache_settings(usecols, max_unique_frac, sep):
+    """Settings a metadata cache is built with; `columns` None means all."""
+    return {'columns': None if usecols is None else sorted(usecols),
+            'max_unique_frac': max_unique_frac,
+            'sep': sep}
+
+def _read_metadata_cache(cache_file, fmt, metadata_file, settings):
+    """
+    Cached metadata, or None if missing, outdated, built with other
+    settings or lacking columns.
+    """
+    import pandas as pd
+    try:
+        if os.path.getmtime(cache_file) < os.path.getmtime(metadata_file):
+            return None
+        if fmt == 'parquet':
+            df = pd.read_parquet(cache_file)
+        else:
+            df = pd.read_feather(cache_file)
+    except (OSError, ImportError, ValueError):
+        return None
+
+    cached = df.attrs.pop(_CACHE_SETTINGS, None)
+    if (not cached
+        or cached.get('max_unique_frac') != settings['max_unique_frac']
+        or cached.get('sep') != settings['sep']):
+        return None
+
+    usecols = settings['columns']
+    if cached.get('columns') is None:
+        # cache of the whole table; any columns can be served from it
+        # (each column is converted independently of the others)
+        if usecols is None:
+            return df
+    elif usecols is None or not set(usecols) <= set(cached['columns']):
+        return None
+    # same column order as read_csv(usecols=...)
+    return df[[c for c in df.columns if c in set(usecols)]]
+
+def _write_metadata_cache(df, cache_file, fmt, settings):
+    """
+    Atomically write the metadata cache, recording the settings it was
+    built with; skipped if pyarrow is missing or the file can't be written.
+    """
+    # unique temp name, also across nodes sharing the file system
+    tmp = f'{cache_file}.{os.uname().nodename}.{os.getpid()}.{os.urandom(4).hex()}.tmp'
+    df.attrs[_CACHE_SETTINGS] = settings
+    try:
+        if fmt == 'parquet':
+            df.to_parquet(tmp, index=False)
+        else:
+            df.reset_index(drop=True).to_feather(tmp)
+        os.replace(tmp, cache_file)
+    except (ImportError, OSError) as e:
+        # e.g. read-only directory; the loaded table is still valid
+        print(f"Not caching metadata ({e})", file=sys.stderr)
+    finally:
+        del df.attrs[_CACHE_SETTINGS]
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def load_metadata(metadata_file, usecols=None, max_unique_frac=0.5, cache=None, sep='\t', verbose=True):
+    """
+    Load a metadata table (e.g. config['metadata']) with a small memory
+    footprint: only the needed columns are read and low-cardinality
+    string columns become `category`.
+
+    Parameters
+    ----------
+    metadata_file : str
+        Path to the metadata table.
+    usecols : list of str, optional
+        Columns to read (the ones the rules use). If None, reads all columns.
+    max_unique_frac : float, optional (default=0.5)
+        Columns with at most this fraction of unique values become `category`.
+    cache : {None, 'parquet', 'feather'}, optional
+        If set, keep a converted copy next to the table
+        (e.g. metadata.tsv.parquet) and read it instead while it is newer
+        than the table and was built with the same columns (or all of
+        them), `max_unique_frac` and `sep`; otherwise it is rebuilt.
+        Needs pyarrow.
+    sep : str, optional (default='\t')
+        Field separator of the table.
+    verbose : bool, optional (default=True)
+        Print the memory used and saved, to stderr (stdout can carry e.g.
+        the `snakemake --dag` output).
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    import pandas as pd
+    if cache is not None and cache not in METADATA_CACHE_FORMATS:
+        raise ValueError(f"cache must be one of {METADATA_CACHE_FORMATS}, got {cache!r}")
+    metadata_file = str(metadata_file)
+    cache_file = f'{metadata_file}.{cache}' if cache else None
+    settings = _cache_settings(usecols, max_unique_frac, sep)
+
+    if cache_file:
+        df = _read_metadata_cache(cache_file, cache, metadata_file, settings)
+        if df is not None:
+            if verbose:
+                print(f"Loaded {metadata_file} from {cache_file}: "
+                      f"{len(df)} rows, {_memory_mb(df):.1f} MB", file=sys.stderr)
+            return df
+
+    df = pd.read_csv(metadata_file, sep=sep, usecols=usecols)
+    before = _memory_mb(df)
+    df = to_categorical(df, max_unique_frac=max_unique_frac)
+    after = _memory_mb(df)
+
+    if verbose:
+        skipped = ''
+        if usecols is not None:
+            n_columns = len(pd.read_csv(metadata_file, sep=sep, nrows=0).columns)
+            skipped = f", {n_columns - len(df.columns)} columns skipped"
+        print(f"Loaded {metadata_file}: {len(df)} rows, {len(df.columns)} columns{skipped}; "
+              f"{before:.1f} MB -> {after:.1f} MB "
+              f"({before - after:.1f} MB saved with categorical columns)",
+              file=sys.stderr)
+
+    if cache_file:
+        _write_metadata_cache(df, cache_file, cache, settings)
+
+    return df
+
+class MetadataIndex:
+    """
+    Hashed lookup table over a metadata DataFrame, so that Snakemake
+    input functions don't filter the whole table on every call.
+
+    Built once (e.g. from config['metadata']); for each set of filter
+    columns the rows are grouped once into a dict {key: row positions},
+    after which lookups are constant time.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The metadata DataFrame.
+
+    Examples
+    --------
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({'sample': ['a', 'a', 'b'], 'rep': ['1', '2', '1'],
+    ...                    'file': ['a1.bam', 'a2.bam', 'b1.bam']})
+    >>> meta = MetadataIndex(df)
+    >>> meta.get('file', {'sample': 'a', 'rep': '2'})
+    'a2.bam'
+    >>> meta.get('file', {'sample': 'a'}, single_output=False)
+    ['a1.bam', 'a2.bam']
+    """
+    def __init__(self, df):
+        self.df = df
+        self._groups = {}
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def _group_index(self, columns):
+        """{key: row positions} for the given filter columns, built on first use."""
+        if columns not in self._groups:
+            by = columns[0] if len(columns) == 1 else list(columns)
+            self._groups[columns] = self.df.groupby(by, sort=False, observed=True).indices
+        return self._groups[columns]
+
+    def _column(self, column):
+        if column not in self._columns:
+            self._columns[column] = self.df[column].to_numpy()
+        return self._columns[column]
+
+    def rows(self, filters):
+        """
+        Positions of the rows matching all `filters` ({column: value}).
+        """
+        import numpy as np
+        if not filters:
+            return np.arange(len(self.df))
+
+        columns = tuple(sorted(filters))
+        groups = self._group_index(columns)
+        key = filters[columns[0]] if len(columns) == 1 else tuple(filters[c] for c in columns)
+        try:
+            return groups.get(key, np.array([], dtype=int))
+        except TypeError:
+            # unhashable value, can't match anything
+            return np.array([], dtype=int)
+
+    def get(self, target_column, filters, single_output=True):
+        """
+        Same as get_value_from_df, with a constant time lookup.
+        """
+        import pandas as pd
+        unique_values = pd.unique(self._column(target_column)[self.rows(filters)])
+        return _unique_output(unique_values, target_column, filters, single_output)
+
+def _unique_output(unique_values, target_column, filters, single_output):
+    """Return contract shared by get_value_from_df and MetadataIndex.get."""
+    if single_output:
+        assert len(unique_values) == 1, (
+            f"Expected a single value in column '{target_column}' "
+            f"after filtering with {filters}, but got {len(unique_values)}: {unique_values}"
+        )
+        return unique_values[0]
+
+    # Multiple values allowed → return as list
+    return list(unique_values)
 
 # function to enable the array-like behaviour in snakemake
 #  (particularly when there are more start than ending files)
@@ -23,8 +274,9 @@ def get_value_from_df(df, target_column, filters, single_output=True):
 
     Parameters
     ----------
-    df : pandas.DataFrame
-        The DataFrame to search in.
+    df : pandas.DataFrame or MetadataIndex
+        The DataFrame to search in. Pass a MetadataIndex built once from
+        the metadata when calling this for many jobs (e.g. in input functions).
     target_column : str
         The column name from which to extract the value(s).
     filters : dict
@@ -46,27 +298,295 @@ def get_value_from_df(df, target_column, filters, single_output=True):
         If single_output=True but the filtered DataFrame does not yield
         exactly one unique value.
     """
-    filtered_df = df.copy(deep=True)
+    if isinstance(df, MetadataIndex):
+        return df.get(target_column, filters, single_output=single_output)
 
+    import numpy as np
+
+    # one combined mask, no copy of the DataFrame
+    mask = np.ones(len(df), dtype=bool)
     for column, value in filters.items():
-        filtered_df = filtered_df.loc[filtered_df[column] == value]
+        mask &= (df[column] == value).to_numpy()
+
+    unique_values = df.loc[mask, target_column].unique()
+
+    return _unique_output(unique_values, target_column, filters, single_output)
+
+def _align_keys(left, right, columns):
+    """
+    Convert the query columns of `left` to the type of the matching columns
+    of `right`, so they can be merged (e.g. string wildcards against an int
+    column read from a TSV). Values that can't be converted become NaN,
+    which matches nothing.
+    """
+    import pandas as pd
+    base = lambda s: s.cat.categories.dtype if isinstance(s.dtype, pd.CategoricalDtype) else s.dtype
+    for column in columns:
+        l, r = left[column], right[column]
+        l_num = pd.api.types.is_numeric_dtype(base(l))
+        r_num = pd.api.types.is_numeric_dtype(base(r))
+        if r_num and not l_num:
+            left[column] = pd.to_numeric(l.astype(object), errors='coerce')
+        elif l_num and not r_num:
+            left[column] = l.astype(str).where(l.notna())
+    return left
+
+def get_values_from_df(df, target_column, queries, single_output=True, errors='report'):
+    """
+    Retrieve value(s) from a DataFrame for many filtering conditions at
+    once (e.g. all wildcard combinations of a rule), with one merge instead
+    of one get_value_from_df call per combination.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame or MetadataIndex
+        The DataFrame to search in.
+    target_column : str
+        The column name from which to extract the value(s).
+    queries : pandas.DataFrame or list of dict
+        One row per set of filters; columns are the columns to filter on.
+        Values are converted to the type of the DataFrame column they
+        filter (e.g. wildcard '2' matches 2 in an int column); values that
+        can't be converted match no rows.
+    single_output : bool, optional (default=True)
+        - If True, each row expects exactly one unique value.
+        - If False, each row gets all unique values as a list.
+    errors : {'report', 'raise'}, optional (default='report')
+        If single_output=True, what to do with rows that don't yield exactly
+        one unique value: 'report' flags them in the output; 'raise' raises
+        an AssertionError listing all of them.
+
+    Returns
+    -------
+    pandas.DataFrame
+        `queries` (same index) with the columns
+        - value: a scalar if single_output=True (None for rows that don't
+          yield exactly one value), else a list of the unique values.
+        - n_values: number of unique values found.
+        - ambiguous: whether more than one unique value was found.
+
+    Examples
+    --------
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({'sample': ['a', 'a', 'b'], 'rep': ['1', '2', '1'],
+    ...                    'file': ['a1.bam', 'a2.bam', 'b1.bam']})
+    >>> q = pd.DataFrame({'sample': ['a', 'b'], 'rep': ['2', '1']})
+    >>> get_values_from_df(df, 'file', q)['value'].tolist()
+    ['a2.bam', 'b1.bam']
+    """
+    import numpy as np
+    import pandas as pd
+    if isinstance(df, MetadataIndex):
+        df = df.df
+    queries = pd.DataFrame(queries)
+    columns = list(queries.columns)
+
+    # NaN never equals anything in get_value_from_df; merge would match it
+    right = (df[columns]
+             .assign(_value=df[target_column].to_numpy())
+             .dropna(subset=columns))
+    left = _align_keys(queries[columns].assign(_row=np.arange(len(queries))), right, columns)
+
+    matches = (left.merge(right, on=columns, how='inner', sort=False)
+                   .drop_duplicates(['_row', '_value'])
+                   .sort_values('_row', kind='stable'))
 
-    unique_values = filtered_df[target_column].unique()
+    n_values = np.bincount(matches['_row'].to_numpy(), minlength=len(queries))
+    result = queries.copy()
+    result['n_values'] = n_values
+    result['ambiguous'] = n_values > 1
 
     if single_output:
-        assert len(unique_values) == 1, (
-            f"Expected a single value in column '{target_column}' "
-            f"after filtering with {filters}, but got {len(unique_values)}: {unique_values}"
-        )
-        return unique_values[0]
+        value = np.full(len(queries), None, dtype=object)
+        unique = matches[n_values[matches['_row'].to_numpy()] == 1]
+        value[unique['_row'].to_numpy()] = unique['_value'].to_numpy()
+        result['value'] = pd.Series(value, index=result.index, dtype=object)
 
-    # Multiple values allowed → return as list
-    return list(unique_values)
+        bad = result[n_values != 1]
+        if errors == 'raise' and len(bad):
+            raise AssertionError(
+                f"Expected a single value in column '{target_column}' "
+                f"for each row, but {len(bad)} rows did not get one:\n"
+                f"{bad[columns + ['n_values']].to_string()}"
+            )
+    else:
+        # matches are sorted by row, so each row's values are one slice
+        values = matches['_value'].to_numpy()
+        offsets = np.concatenate([[0], np.cumsum(n_values)])
+        value = [list(values[a:b]) for a, b in zip(offsets[:-1], offsets[1:])]
+        result['value'] = pd.Series(value, index=result.index, dtype=object)
+
+    return result
+
+# where the job logs go, relative to the workflow directory
+LOG_DIR = 'smk_logs'
+
+# hex digits of the hash used to shard log files (2 -> up to 256 subdirectories per rule)
+LOG_SHARD_WIDTH = 2
+
+def _wildcard_items(wildcards):
+    """(name, value) pairs of a Snakemake wildcards object, dict, namedtuple or namespace."""
+    if isinstance(wildcards, dict):
+        return list(wildcards.items())
+    if hasattr(wildcards, 'items'):  # snakemake.io.Wildcards
+        return list(wildcards.items())
+    if hasattr(wildcards, '_asdict'):
+        return list(wildcards._asdict().items())
+    return list(vars(wildcards).items())
+
+class LogLayout:
+    """
+    Log paths for the jobs of a workflow, sharded into hashed
+    subdirectories so that no directory gets tens of thousands of files:
+
+        <log_dir>/<rule>/<shard>/<rule>_<wildcards>_<job id>.<ext>
+
+    Paths are memoized. Nothing is created when a path is handed out, since
+    Snakemake also evaluates params and log paths in dry runs (-n, --dag);
+    the directories can be created in one batch with make_dirs(), and
+    submit_smk.sh creates the one of each Slurm log (slurm_log) when it
+    submits the job.
+
+    Parameters
+    ----------
+    log_dir : str
+        Directory all logs go in.
+    shard_width : int
+        Hex digits of the shard subdirectory names; 0 for no sharding.
+
+    Examples
+    --------
+    >>> layout = LogLayout(shard_width=1)
+    >>> layout.path('align', {'sample': 's1'})
+    'smk_logs/align/7/align_sample=s1_%j.log'
+    >>> sorted(layout.dirs)
+    ['smk_logs/align/7']
+    """
+    def __init__(self, log_dir=LOG_DIR, shard_width=LOG_SHARD_WIDTH):
+        self.log_dir = str(log_dir)
+        self.shard_width = shard_width
+        self.dirs = set()
+        self._paths = {}
+        self._created = set()
+
+    def shard(self, name):
+        """Shard subdirectory of a log file name."""
+        return hashlib.sha1(name.encode()).hexdigest()[:self.shard_width]
+
+    def path(self, rule_name, wildcards, ext="log", job_id="%j"):
+        """
+        Log path of one job.
+
+        Parameters
+        ----------
+        rule_name : str
+            The name of the Snakemake rule.
+        wildcards : object
+            The wildcards of the job (Snakemake wildcards, dict, namedtuple
+            or SimpleNamespace). Each one is included in the filename.
+        ext : str, optional
+            File extension for the log file (default is "log").
+        job_id : str, optional
+            Slurm job ID placeholder (default is "%j"). Can be left empty for non-Slurm logs.
+
+        Returns
+        -------
+        str
+        """
+        items = tuple(_wildcard_items(wildcards))
+        key = (rule_name, items, ext, job_id)
+        try:
+            return self._paths[key]
+        except KeyError:
+            pass
+
+        name = "_".join([rule_name] + [f"{k}={v}" for k, v in items])
+        log_dir = f"{self.log_dir}/{rule_name}"
+        if self.shard_width:
+            log_dir = f"{log_dir}/{self.shard(name)}"
+        file = f"{name}_{job_id}" if job_id else name
+
+        self.dirs.add(log_dir)
+        self._paths[key] = path = f"{log_dir}/{file}.{ext}"
+        return path
+
+    def paths(self, rule_name, wildcards_table, ext="log", job_id="%j"):
+        """
+        Log paths of many jobs of a rule at once.
+
+        Parameters
+        ----------
+        wildcards_table : pandas.DataFrame or list of dict
+            One row per job; columns are the wildcards.
+
+        Returns
+        -------
+        list of str
+        """
+        if hasattr(wildcards_table, 'to_dict'):  # pandas.DataFrame
+            wildcards_table = wildcards_table.to_dict('records')
+        return [self.path(rule_name, wc, ext=ext, job_id=job_id) for wc in wildcards_table]
+
+    def slurm_log(self, rule_name, ext="out"):
+        """
+        Input function for a rule's `params: slurm_log`, used by
+        submit_smk.sh as the sbatch -o path. The directory is not created
+        here but by submit_smk.sh, only for the jobs it submits.
+        """
+        def slurm_log(wildcards):
+            return self.path(rule_name, wildcards, ext=ext)
+        return slurm_log
+
+    def add_slurm_logs(self, rules, ext="out"):
+        """
+        Give `params: slurm_log` to the rules that run a job but don't
+        set it, since submit_smk.sh passes it to sbatch -o for every job.
+        Call it after all rules are defined (e.g. `workflow.rules` at the
+        end of the Snakefile).
+
+        Parameters
+        ----------
+        rules : iterable of snakemake.rules.Rule
+
+        Returns
+        -------
+        list of str
+            Names of the rules that were given a slurm_log.
+        """
+        added = []
+        for rule in rules:
+            if rule.norun or hasattr(rule.params, 'slurm_log'):
+                continue
+            rule.set_params(slurm_log=self.slurm_log(rule.name, ext=ext))
+            added.append(rule.name)
+        return added
+
+    def make_dirs(self):
+        """
+        Create the directories of all log paths handed out so far,
+        each one once.
+
+        Returns
+        -------
+        list of str
+            Directories that were created.
+        """
+        new = sorted(self.dirs - self._created)
+        for d in new:
+            os.makedirs(d, exist_ok=True)
+        self._created.update(new)
+        return new
+
+# shared by the Snakefile and the rule modules
+log_layout = LogLayout()
 
 def wildcard_log_path(wildcards, rule_name, ext="log", job_id="%j"):
     """
     Generate a log filename including the rule name, all wildcards, and the Slurm job ID.
 
+    The file goes in a hashed subdirectory (see LogLayout); create the
+    directories with `log_layout.make_dirs()`.
+
     Parameters
     ----------
     wildcards : object
@@ -83,7 +603,115 @@ def wildcard_log_path(wildcards, rule_name, ext="log", job_id="%j"):
     str
         A string representing the log file path.
     """
-    # works with namedtuple (Snakemake wildcards) or SimpleNamespace
-    parts = [f"{k}={v}" for k, v in vars(wildcards).items()]
-    wc_str = "_".join(parts)
-    return str(Path("smk_logs") / f"{rule_name}_{wc_str}_{job_id}.{ext}")
+    return log_layout.path(rule_name, wildcards, ext=ext, job_id=job_id)
+
+# rule definitions and references to other rules in Snakemake files
+_RULE_DEF_RE = re.compile(r'^\s*(?:rule|checkpoint)\s+(\w+)\s*:', re.M)
+_RULE_USE_RE = re.compile(r'\brules\.(\w+)|^\s*use\s+rule\s+(\w+)', re.M)
+
+def scan_rule_module(path):
+    """
+    Rules defined in a Snakemake file and rules it refers to
+    (`rules.<name>` and `use rule <name>`), without parsing it with Snakemake.
+
+    Returns
+    -------
+    defines : set of str
+    uses : set of str
+    """
+    with open(path) as f:
+        text = f.read()
+    defines = set(_RULE_DEF_RE.findall(text))
+    uses = {a or b for a, b in _RULE_USE_RE.findall(text)} - defines
+    return defines, uses
+
+def rules_used_in(snakefile):
+    """
+    Rules a Snakefile refers to by name (`rules.<name>`, `use rule <name>`)
+    but does not define (e.g. 'Snakefile'). Rules only reached through
+    file dependencies (e.g. the inputs of `rule all`) are not included.
+    """
+    return sorted(scan_rule_module(snakefile)[1])
+
+def find_rule_modules(rules_dir, targets=None):
+    """
+    Rule modules (*.smk) under `rules_dir`, recursively, in a stable order.
+
+    Parameters
+    ----------
+    rules_dir : str
+        Directory with the rule modules.
+    targets : list of str, optional
+        Regexes of the rule names needed. If given, only the modules
+        defining matching rules are returned, plus the modules defining
+        the rules those refer to by name (`rules.<name>`, `use rule <name>`).
+        File dependencies are not followed: a rule that only produces an
+        input of a selected rule (or of `rule all`) must match `targets`
+        itself, or its module is left out. If None, all modules.
+
+    Returns
+    -------
+    list of str
+        Paths of the modules, sorted by path relative to `rules_dir`.
+    """
+    rules_dir = str(rules_dir)
+    modules = []
+    for root, dirs, files in os.walk(rules_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        modules.extend(os.path.join(root, f) for f in files if f.endswith('.smk'))
+    modules.sort(key=lambda m: os.path.relpath(m, rules_dir).split(os.sep))
+
+    if targets is None:
+        return modules
+
+    scans = {m: scan_rule_module(m) for m in modules}
+    defined_in = {rule: m for m in modules for rule in scans[m][0]}
+
+    target_re = re.compile('|'.join(f'(?:{t})' for t in targets)) if targets else None
+    todo = [r for r in defined_in if target_re and target_re.fullmatch(r)]
+
+    # add the modules of the rules the selected modules refer to
+    needed = set()
+    while todo:
+        m = defined_in.get(todo.pop())
+        if m is None or m in needed:
+            continue
+        needed.add(m)
+        todo.extend(scans[m][1])
+
+    return [m for m in modules if m in needed]
+
+class ModuleTimings:
+    """
+    Time taken to include (parse) each rule module, to find slow ones.
+
+    Examples
+    --------
+    In a Snakefile:
+
+        module_timings = ModuleTimings()
+        for f in find_rule_modules(rules_dir):
+            with module_timings.time(f):
+                include: f
+        print(module_timings.report(), file=sys.stderr)
+    """
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def time(self, module):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[module] = self.seconds.get(module, 0) + time.perf_counter() - start
+
+    def total(self):
+        return sum(self.seconds.values())
+
+    def report(self, top=10):
+        """Slowest modules first, as a printable table."""
+        slowest = sorted(self.seconds.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        lines = [f"Included {len(self.seconds)} rule modules in {self.total():.3f}s"]
+        lines += [f"  {sec:8.3f}s  {module}" for module, sec in slowest]
+        return '\n'.join(lines)
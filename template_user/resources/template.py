@@ -1,8 +1,15 @@
 # HEADER ------------------------------------------------------------------------
-from pyprojroot.here import here
-import sys
-sys.path.append(str(here()))
+import os, sys, time
+header_start = time.perf_counter() # set PROJ_PROFILE_STARTUP=1 to see how long each step of this header takes
+from pathlib import Path
+# project root: $PROJ_ROOT if it has a .here file, else the closest dir with one
+for root in [Path(os.environ.get('PROJ_ROOT') or Path.cwd()), Path.cwd(), *Path.cwd().parents]:
+    if (root / '.here').exists(): break
+else:
+    sys.exit('No .here file in the current directory or its parents: run from inside the project or set PROJ_ROOT')
+sys.path.append(str(root))
 from resources.utils import * # if the ModuleNotFound in mn5 it is probably because of the module you used. Use module load anaconda
 config = load_config() # to refer to files in config use config$
 paths = load_paths() # to refer to data, figs, metadata, ref, scratch use resulting paths$
+profile_startup(header_start) # only prints if PROJ_PROFILE_STARTUP=1
 #--------------------------------------------------------------------------------
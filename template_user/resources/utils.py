@@ -15,20 +15,415 @@
 ############ --------------------------------------------------------------- ############
 
 # import packages
+import time
+_IMPORT_START = time.perf_counter()
+
 import yaml
 import os
-import getpass
-import subprocess
+import sys
+import re
+import functools
+import hashlib
+import pickle
+import atexit
+import threading
+import contextlib
+# subprocess, getpass, shutil and concurrent.futures are imported in the
+# functions that use them, so that load_config / load_paths don't load them
 from pathlib import Path
 from collections import defaultdict, Counter
-import copy
+from collections.abc import Mapping
+from types import MappingProxyType
 
 d = Path(__file__).parent
 CONFIG_FILE = str(Path(f'{d}/config.yml').resolve())
 MN5_CONFIG_FILE = str(Path(f'{d}/config_mn5.yml').resolve())
 RESOURCES_FILE = str(Path(f'{d}/resources.yml').resolve())
 TEMPLATE_PROJECT_NAME = 'project_template'
+SNAPSHOT_DIRNAME = '.config_snapshots'
+SNAPSHOT_VERSION = 1
+
+# the user dir (project root for the code) is the directory with this file;
+# once found, it is kept for this process and, through the environment
+# variable, for its children (e.g. Snakemake jobs)
+PROJECT_ROOT_MARKER = '.here'
+PROJECT_ROOT_ENV = 'PROJ_ROOT'
+_PROJECT_ROOT = None
+
+# prefer the C LibYAML bindings when PyYAML was built with them; they behave
+# the same as the pure-Python SafeLoader / Dumper, only faster
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, 'CDumper', yaml.Dumper)
+
+# process-wide cache for load_paths / load_config; entries are keyed on the
+# source files + user and invalidated when a file's mtime or size changes
+_CACHE = {}
+_CACHE_STATS = Counter()
+
+# set to get a per-phase breakdown of the template header (see profile_startup)
+PROFILE_STARTUP_ENV = 'PROJ_PROFILE_STARTUP'
+
+class StartupProfiler:
+    """
+    Per-phase timings of the project setup done by the template header.
+
+    Functions decorated with `profile(phase)` add their run time to that
+    phase; time spent in a nested profiled call only counts for the inner
+    phase. Does nothing (beyond one attribute check per call) unless enabled.
+
+    Parameters
+    ----------
+    enabled : bool
+        Whether to record timings.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.seconds = defaultdict(float)
+        # time spent in profiled calls nested in each running call
+        self._nested = []
+
+    def profile(self, phase):
+        """Decorator adding the run time of every call to `phase`."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                self._nested.append(0.0)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    self.seconds[phase] += elapsed - self._nested.pop()
+                    if self._nested:
+                        self._nested[-1] += elapsed
+            return wrapper
+        return decorator
+
+    def clear(self):
+        self.seconds.clear()
+
+startup_profiler = StartupProfiler(enabled=bool(os.environ.get(PROFILE_STARTUP_ENV)))
+
+# set to a file path to record metrics (see Metrics) and add them to that file
+# at exit; Prometheus text format if the file ends in .prom, JSON otherwise
+METRICS_ENV = 'PROJ_METRICS'
+
+def _escape_label(value):
+    """Escape a Prometheus label value."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metrics:
+    """
+    Call counts, cumulative time and bytes read / written of instrumented
+    steps, and durations of the subprocesses they run.
+
+    Functions decorated with `timed(step)` and blocks run in `step(step)`
+    count as one call of that step; a step called again from within itself
+    (e.g. load_config calling itself) is only counted once. Does nothing
+    (beyond one attribute check per call) unless enabled. Safe to use from
+    several threads.
+
+    Parameters
+    ----------
+    enabled : bool
+        Whether to record metrics.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # steps running in the current thread
+        self._local = threading.local()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.steps = defaultdict(Counter)
+            self.commands = defaultdict(Counter)
+
+    def _running(self):
+        running = getattr(self._local, 'running', None)
+        if running is None:
+            running = self._local.running = set()
+        return running
+
+    @contextlib.contextmanager
+    def _record(self, step):
+        running = self._running()
+        if step in running:
+            yield
+            return
+        running.add(step)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            running.discard(step)
+            with self._lock:
+                self.steps[step]['calls'] += 1
+                self.steps[step]['seconds'] += elapsed
+
+    def step(self, step):
+        """Context manager counting the block as one call of `step`."""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._record(step)
+
+    def timed(self, step):
+        """Decorator counting every call as one call of `step`."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self._record(step):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_bytes(self, step, read=0, written=0):
+        """Add bytes read and / or written to `step`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.steps[step]['bytes_read'] += read
+            self.steps[step]['bytes_written'] += written
+
+    @contextlib.contextmanager
+    def _command(self, name):
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.commands[name]['calls'] += 1
+                self.commands[name]['seconds'] += elapsed
+                self.commands[name]['failures'] += not ok
+
+    def command(self, cmd):
+        """
+        Context manager recording the duration of a subprocess, under the
+        name of the program run (e.g. 'git').
+
+        Parameters
+        ----------
+        cmd : str | list
+            Command run in the block.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        prog = cmd.split(maxsplit=1)[0] if isinstance(cmd, str) else cmd[0]
+        return self._command(os.path.basename(str(prog)))
+
+    def to_dict(self):
+        """
+        Recorded metrics.
+
+        Returns
+        -------
+        dict
+            {'steps': {step: {'calls', 'seconds', 'bytes_read', 'bytes_written'}},
+             'commands': {program: {'calls', 'seconds', 'failures'}}}
+        """
+        with self._lock:
+            steps = {step: {'calls': c['calls'], 'seconds': c['seconds'],
+                            'bytes_read': c['bytes_read'], 'bytes_written': c['bytes_written']}
+                     for step, c in sorted(self.steps.items())}
+            commands = {prog: {'calls': c['calls'], 'seconds': c['seconds'],
+                               'failures': c['failures']}
+                        for prog, c in sorted(self.commands.items())}
+        return {'steps': steps, 'commands': commands}
+
+    def to_json(self, **kwargs):
+        """Recorded metrics as a JSON string; kwargs are passed to json.dumps."""
+        import json
+        kwargs.setdefault('indent', 2)
+        return json.dumps(self.to_dict(), **kwargs)
+
+    # (group, label, key, metric name, help) of the Prometheus metric families
+    PROMETHEUS_FAMILIES = [
+        ('steps', 'step', 'calls', 'calls_total', 'Calls of an instrumented step.'),
+        ('steps', 'step', 'seconds', 'seconds_total', 'Cumulative wall time of an instrumented step.'),
+        ('steps', 'step', 'bytes_read', 'read_bytes_total', 'Bytes read by an instrumented step.'),
+        ('steps', 'step', 'bytes_written', 'written_bytes_total', 'Bytes written by an instrumented step.'),
+        ('commands', 'command', 'calls', 'subprocess_calls_total', 'Subprocesses run, by program.'),
+        ('commands', 'command', 'seconds', 'subprocess_seconds_total', 'Cumulative wall time of subprocesses, by program.'),
+        ('commands', 'command', 'failures', 'subprocess_failures_total', 'Subprocesses that failed, by program.'),
+    ]
+
+    def to_prometheus(self, prefix='proj'):
+        """
+        Recorded metrics in the Prometheus text exposition format
+        (e.g. for the node exporter textfile collector).
+
+        Parameters
+        ----------
+        prefix : str
+            Prefix of the metric names.
+
+        Returns
+        -------
+        str
+        """
+        data = self.to_dict()
+        lines = []
+        for group, label, key, name, help_text in self.PROMETHEUS_FAMILIES:
+            name = f'{prefix}_{name}'
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f'{name}{{{label}="{_escape_label(k)}"}} {v[key]}'
+                      for k, v in data[group].items()]
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def parse_prometheus(cls, text, prefix='proj'):
+        """
+        Metrics written by to_prometheus, in the format of to_dict.
+
+        Raises
+        ------
+        ValueError
+            If a sample line is not one to_prometheus writes.
+        """
+        families = {f'{prefix}_{name}': (group, key)
+                    for group, _, key, name, _ in cls.PROMETHEUS_FAMILIES}
+        sample_re = re.compile(r'(\w+)\{\w+="((?:[^"\\]|\\.)*)"\} (\S+)')
+        unescape = lambda v: re.sub(r'\\(.)', lambda m: '\n' if m[1] == 'n' else m[1], v)
+        data = {'steps': defaultdict(dict), 'commands': defaultdict(dict)}
+        for line in text.splitlines():
+            if not line or line.startswith('#'):
+                continue
+            match = sample_re.fullmatch(line)
+            if not match or match[1] not in families:
+                raise ValueError(f"Not a metrics sample: {line!r}")
+            group, key = families[match[1]]
+            value = float(match[3])
+            data[group][unescape(match[2])][key] = value if key == 'seconds' else int(value)
+        return {group: dict(d) for group, d in data.items()}
+
+    def merge(self, data):
+        """Add metrics in the format of to_dict (e.g. of another process)."""
+        with self._lock:
+            for group, counters in [('steps', self.steps), ('commands', self.commands)]:
+                for name, values in data.get(group, {}).items():
+                    counters[name].update(values)
+
+    def write(self, file, merge=False):
+        """
+        Write the recorded metrics to `file`, in Prometheus text format if
+        it ends in .prom and as JSON otherwise. The file is replaced
+        atomically, so readers never see a partial file.
+
+        Parameters
+        ----------
+        file : str | Path
+        merge : bool, default False
+            If True, add the metrics already in `file` (e.g. of other jobs
+            of a pipeline) to this process's. Writers take a lock on
+            `<file>.lock` so concurrent processes (also on other nodes, if
+            the file system supports locks) don't lose each other's metrics.
+            An unreadable `file` is replaced.
+        """
+        import fcntl
+        file = Path(file)
+        prom = file.suffix == '.prom'
+        file.parent.mkdir(parents=True, exist_ok=True)
+
+        with contextlib.ExitStack() as stack:
+            total = self
+            if merge:
+                lock = stack.enter_context(open(f'{file}.lock', 'a'))
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                total = Metrics(enabled=True)
+                total.merge(self.to_dict())
+                try:
+                    text = file.read_text()
+                    total.merge(self.parse_prometheus(text) if prom else _json_loads(text))
+                except FileNotFoundError:
+                    pass
+                except ValueError as e:
+                    print(f"Replacing unreadable metrics file {file} ({e})", file=sys.stderr)
+
+            tmp = _tmp_name(file)
+            try:
+                tmp.write_text(total.to_prometheus() if prom else total.to_json())
+                os.replace(tmp, file)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+
+def _json_loads(text):
+    import json
+    return json.loads(text)
+
+metrics = Metrics(enabled=bool(os.environ.get(METRICS_ENV)))
+if metrics.enabled:
+    # every process (e.g. each Snakemake job) adds its metrics to the file
+    atexit.register(metrics.write, os.environ[METRICS_ENV], merge=True)
+
+@startup_profiler.profile('yaml parse')
+def parse_yml(stream, loader=None):
+    """
+    Parse YAML from a string or open file.
+
+    Parameters
+    ----------
+    stream : str | bytes | file-like
+        YAML document.
+    loader : yaml.Loader class | None
+        Loader to use. Defaults to YAML_LOADER (C-accelerated safe loader
+        when available, otherwise yaml.SafeLoader).
+
+    Returns
+    -------
+    object
+        Parsed YAML contents.
+    """
+    return yaml.load(stream, Loader=loader or YAML_LOADER)
+
+@metrics.timed('dump_yml')
+def dump_yml(data, stream=None, dumper=None, **kwargs):
+    """
+    Serialize data as YAML.
+
+    Parameters
+    ----------
+    data : object
+        Data to serialize.
+    stream : file-like | None
+        Open file to write to. If None, the YAML is returned as a string.
+    dumper : yaml.Dumper class | None
+        Dumper to use. Defaults to YAML_DUMPER (C-accelerated when
+        available, otherwise yaml.Dumper, as used by yaml.dump).
+    **kwargs
+        Passed to yaml.dump (default_flow_style defaults to False).
+
+    Returns
+    -------
+    str | None
+        The YAML string if `stream` is None.
+    """
+    kwargs.setdefault('default_flow_style', False)
+    if not metrics.enabled:
+        return yaml.dump(data, stream, Dumper=dumper or YAML_DUMPER, **kwargs)
 
+    # bytes written: from the stream position, when the stream has one
+    try:
+        start = stream.tell() if stream is not None else None
+    except (AttributeError, OSError):
+        start = None
+    out = yaml.dump(data, stream, Dumper=dumper or YAML_DUMPER, **kwargs)
+    if stream is None:
+        metrics.add_bytes('dump_yml', written=len(out))
+    elif start is not None:
+        metrics.add_bytes('dump_yml', written=stream.tell() - start)
+    return out
+
+@metrics.timed('load_yml')
 def load_yml(file):
     """
     Load a YAML file from disk.
@@ -48,8 +443,64 @@ def load_yml(file):
         raise FileNotFoundError(f"YAML file not found: {path}")
 
     with path.open("r") as f:
-        return yaml.safe_load(f)
+        if metrics.enabled:
+            metrics.add_bytes('load_yml', read=os.fstat(f.fileno()).st_size)
+        return parse_yml(f)
+
+
+@startup_profiler.profile('root discovery')
+def find_project_root(start=None):
+    """
+    Find the project root (user dir): the directory with the `.here` file.
+
+    Without `start`, the answer is cached for the process and exported as
+    PROJ_ROOT, so it is looked up in this order, stopping at the first hit:
+    the process cache, the PROJ_ROOT environment variable (if it has a
+    `.here` file), the parent of this file's directory (one stat), and the
+    current directory and its parents.
+
+    Parameters
+    ----------
+    start : str | Path | None
+        If given, only search this directory and its parents, uncached.
+
+    Returns
+    -------
+    Path
+        Project root.
 
+    Raises
+    ------
+    FileNotFoundError
+        If no directory has a `.here` file.
+    """
+    global _PROJECT_ROOT
+
+    if start is not None:
+        return _find_marker(Path(start).resolve())
+
+    if _PROJECT_ROOT is None:
+        # a PROJ_ROOT inherited from another shell / project may be stale
+        env = os.environ.get(PROJECT_ROOT_ENV)
+        root = Path(env) if env else None
+        if root is None or not (root / PROJECT_ROOT_MARKER).exists():
+            root = Path(__file__).resolve().parents[1]
+            if not (root / PROJECT_ROOT_MARKER).exists():
+                root = _find_marker(Path.cwd())
+        _PROJECT_ROOT = root
+        os.environ[PROJECT_ROOT_ENV] = str(root)
+
+    return _PROJECT_ROOT
+
+def _find_marker(start):
+    """First of `start` and its parents with a `.here` file."""
+    for d in [start, *start.parents]:
+        if (d / PROJECT_ROOT_MARKER).exists():
+            return d
+    raise FileNotFoundError(
+        f"No {PROJECT_ROOT_MARKER} file in {start} or its parents; "
+        f"run from inside the project or set {PROJECT_ROOT_ENV}"
+    )
 
 def load_resources(resources=None):
     """
@@ -57,8 +508,8 @@ def load_resources(resources=None):
 
     Parameters
     ----------
-    resources : str | dict | None
-        - str: path to a YAML file
+    resources : str | Path | dict | None
+        - str | Path: path to a YAML file
         - dict: pre-loaded resources dictionary (useful for testing)
         - None: defaults to RESOURCES_FILE
 
@@ -73,17 +524,19 @@ def load_resources(resources=None):
     if isinstance(resources, dict):
         return resources
 
-    if isinstance(resources, str):
+    if isinstance(resources, (str, Path)):
         return load_yml(resources)
 
     raise TypeError(
-        f"Resources must be a dict, str (path), or None, got {type(resources)}"
+        f"Resources must be a dict, str | Path (path), or None, got {type(resources)}"
     )
 
 
+@startup_profiler.profile('path map')
 def load_paths(resources=None,
                username=None,
-               mn5_user=False):
+               mn5_user=False,
+               cache=True):
     """
     Load the relevant path mappings for the current user.
 
@@ -95,31 +548,70 @@ def load_paths(resources=None,
         Username to load paths for. If None, will try system user if fallback is True.
     mn5_user : bool, default False
         If True, force use of the 'mn5_user' paths.
+    cache : bool, default True
+        If True and `resources` is a file, reuse the result of a previous call
+        as long as the file has not changed (see `cache_stats`, `clear_cache`).
 
     Returns
     -------
     dict[str, str]
         Mapping of keys (like 'data_dir', 'ref_dir') to absolute paths.
+        Cached results are returned as a read-only mapping.
     """
-    resources = load_resources(resources)
+    username = get_username(username, mn5_user)
 
-    if mn5_user:
-        username = "mn5_user"
-    elif username is None:
-        username = getpass.getuser()
+    if resources is None:
+        resources = RESOURCES_FILE
 
-    path_map = resources['path_map']
+    if cache and isinstance(resources, (str, Path)):
+        return _cached('paths', [resources], username,
+                       lambda: load_paths(resources, username, cache=False))
 
-    if username not in path_map:
-        raise ValueError(
-            f"Username {username} not found in resources. "
-            f"Available: {list(path_map.keys())}"
-        )
+    resources = load_resources(resources)
+
+    if 'user_index' in resources:
+        # single lookup of the user's alias / system and paths
+        user_paths = lookup_user(username, resources)['paths']
+    else:
+        # resources.yml written before the user index
+        path_map = resources['path_map']
+        if username not in path_map:
+            raise ValueError(
+                f"Username {username} not found in resources. "
+                f"Available: {list(path_map.keys())}"
+            )
+        user_paths = path_map[username]
 
     # normalize all paths as Path w/ symlink / relative path resolution
-    return {k: str(Path(v).resolve()) for k, v in path_map[username].items()}
+    paths = {k: str(v) for k, v in user_paths.items()}
+    resolved = resolve_paths(paths.values())
+    return {k: resolved[v] for k, v in paths.items()}
+
+def get_username(username=None, mn5_user=False):
+    """
+    Username whose paths should be loaded from the path map.
+
+    Parameters
+    ----------
+    username : str | None
+        Explicit username. If None, the current system user.
+    mn5_user : bool, default False
+        If True, always 'mn5_user'.
 
-def load_config(config=None, resources=None, **kwargs):
+    Returns
+    -------
+    str
+    """
+    if mn5_user:
+        return "mn5_user"
+    elif username is None:
+        import getpass
+        return getpass.getuser()
+    return username
+
+@metrics.timed('load_config')
+def load_config(config=None, resources=None, cache=True, lazy=False,
+                snapshot=True, **kwargs):
     """
     Load the project configuration with absolute paths applied.
 
@@ -133,6 +625,17 @@ def load_config(config=None, resources=None, **kwargs):
         - str | Path: path to a resources.yml file
         - dict: pre-loaded resources dictionary
         - None: defaults to RESOURCES_FILE
+    cache : bool, default True
+        If True and both `config` and `resources` are files, reuse the result
+        of a previous call as long as neither file has changed.
+    lazy : bool, default False
+        If True, return a LazyConfig that only substitutes and resolves
+        the entries that are actually accessed.
+    snapshot : bool, default True
+        If True and both `config` and `resources` are files, load the
+        resolved config from its binary snapshot when it is up to date,
+        and rebuild the snapshot when it is not (see save_config_snapshot).
+        Ignored if `lazy`.
     **kwargs : dict
         Passed to get_path_map (e.g. username, mn5_user, etc.)
 
@@ -140,10 +643,30 @@ def load_config(config=None, resources=None, **kwargs):
     -------
     dict
         Configuration dictionary with absolute paths resolved.
+        Cached results are returned as a read-only snapshot
+        (mappings are read-only and lists become tuples).
+        If `lazy`, a read-only LazyConfig mapping instead.
     """
-    # --- Load config
     if config is None:
         config = CONFIG_FILE
+    if resources is None:
+        resources = RESOURCES_FILE
+
+    if (cache
+        and isinstance(config, (str, Path))
+        and isinstance(resources, (str, Path))):
+        username = get_username(**kwargs)
+        kind = 'lazy_config' if lazy else 'config'
+        return _cached(kind, [config, resources], username,
+                       lambda: load_config(config, resources, cache=False,
+                                           lazy=lazy, snapshot=snapshot, **kwargs))
+
+    if (snapshot and not lazy
+        and isinstance(config, (str, Path))
+        and isinstance(resources, (str, Path))):
+        return load_config_snapshot(config, resources, **kwargs)
+
+    # --- Load config
     if isinstance(config, dict):
         config_dict = config
     elif isinstance(config, (str, Path)):
@@ -152,7 +675,10 @@ def load_config(config=None, resources=None, **kwargs):
         raise TypeError("config must be dict, str, Path, or None")
 
     # --- Load path map from resources
-    path_map = get_path_map(resources=resources, **kwargs)
+    path_map = get_path_map(resources=resources, cache=cache, **kwargs)
+
+    if lazy:
+        return LazyConfig(config_dict, path_map)
 
     # --- Apply replacements & resolve symlinks
     config_dict = replace_str_dict(config_dict, path_map)
@@ -160,6 +686,297 @@ def load_config(config=None, resources=None, **kwargs):
 
     return config_dict
 
+class LazyConfig(Mapping):
+    """
+    Read-only configuration mapping that applies path placeholders and
+    resolves symlinks only for the entries that are accessed.
+
+    Nested dicts are returned as LazyConfig objects; any other value
+    (string, list, number, ...) is substituted, resolved and frozen
+    on first access, and the result is cached.
+
+    Parameters
+    ----------
+    data : dict
+        Parsed configuration, with placeholders (e.g. './{proj_data_dir}').
+    path_map : dict[str, str] | callable
+        Output of get_path_map, or a function from compile_substitutions.
+
+    Examples
+    --------
+    >>> config = load_config(lazy=True)
+    >>> config['metadata']  # only this entry is resolved
+    """
+    def __init__(self, data, path_map):
+        self._data = data
+        self._sub = path_map if callable(path_map) else compile_substitutions(path_map)
+        self._resolved = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+
+        value = self._data[key]
+        if isinstance(value, dict):
+            value = LazyConfig(value, self._sub)
+        else:
+            value = freeze(resolve_config_symlinks(replace_str_dict(value, self._sub)))
+        self._resolved[key] = value
+        return value
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f'LazyConfig({list(self._data)})'
+
+    def to_dict(self):
+        """
+        Resolve all entries and return them as a regular (mutable) dict.
+        """
+        return {k: v.to_dict() if isinstance(v, LazyConfig) else _thaw(v)
+                for k, v in self.items()}
+
+def _thaw(d):
+    """Inverse of freeze for tuples; used to export frozen leaves."""
+    if isinstance(d, tuple):
+        return [_thaw(item) for item in d]
+    elif isinstance(d, Mapping):
+        return {k: _thaw(v) for k, v in d.items()}
+    else:
+        return d
+
+def freeze(d):
+    """
+    Recursively convert a nested structure into a read-only snapshot.
+
+    Dicts become read-only mappings and lists become tuples, so a cached
+    result can be shared between callers without being mutated.
+
+    Parameters
+    ----------
+    d : dict, list, or other
+
+    Returns
+    -------
+    MappingProxyType, tuple, or other
+    """
+    if isinstance(d, dict):
+        return MappingProxyType({k: freeze(v) for k, v in d.items()})
+    elif isinstance(d, list):
+        return tuple(freeze(item) for item in d)
+    else:
+        return d
+
+def config_snapshot_file(config, username):
+    """
+    Path of the binary snapshot of `config` resolved for `username`.
+
+    Snapshots are stored in a `.config_snapshots/` directory
+    next to the config file, one pickle per user.
+    """
+    return Path(config).resolve().parent / SNAPSHOT_DIRNAME / f'{username}.pkl'
+
+def _snapshot_digest(config, resources, username):
+    """Hash of the source YAML files + username a snapshot was built from."""
+    h = hashlib.sha256(f'{SNAPSHOT_VERSION}\0{username}'.encode())
+    for f in [config, resources]:
+        h.update(b'\0')
+        h.update(Path(f).read_bytes())
+    return h.hexdigest()
+
+def _build_config_snapshot(config, resources, username):
+    """Resolve `config` for `username` and wrap it with its snapshot metadata."""
+    config_dict = load_yml(config)
+    path_map = get_path_map(resources=resources, username=username, cache=False)
+    config_dict = replace_str_dict(config_dict, path_map)
+
+    # relative paths are resolved against the working directory, so a
+    # snapshot that contains any is only valid from the same directory
+    strings = list(path_map.values()) + [s for s in _iter_strings(config_dict)
+                                         if is_path_like(s)]
+    cwd = os.getcwd() if any(not os.path.isabs(s) for s in strings) else None
+
+    return {'digest': _snapshot_digest(config, resources, username),
+            'cwd': cwd,
+            'config': resolve_config_symlinks(config_dict)}
+
+def _tmp_name(file):
+    """
+    Temp file name next to `file` that is unique across processes and
+    nodes sharing the file system (e.g. GPFS): host, pid and a random part.
+    """
+    file = Path(file)
+    return file.with_name(f'{file.name}.{os.uname().nodename}.{os.getpid()}.'
+                          f'{os.urandom(4).hex()}.tmp')
+
+def _write_snapshot(snapshot, file):
+    """Atomically write a snapshot so concurrent jobs never read a partial file."""
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp_name(file)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, file)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+def save_config_snapshot(config=None, resources=None, **kwargs):
+    """
+    Resolve the configuration for one user and save it as a binary snapshot.
+
+    Parameters
+    ----------
+    config : str | Path | None
+        Path to a config.yml file, or None for default CONFIG_FILE.
+    resources : str | Path | None
+        Path to a resources.yml file, or None for default RESOURCES_FILE.
+    **kwargs
+        Passed to get_username (username, mn5_user).
+
+    Returns
+    -------
+    Path
+        Path of the written snapshot.
+    """
+    config = config or CONFIG_FILE
+    resources = resources or RESOURCES_FILE
+    username = get_username(**kwargs)
+
+    file = config_snapshot_file(config, username)
+    _write_snapshot(_build_config_snapshot(config, resources, username), file)
+    return file
+
+def save_config_snapshots(config=None, resources=None):
+    """
+    Save a binary config snapshot for every user in the resources path map.
+
+    Paths are resolved on the current system, so run this on the
+    system the snapshots will be used on.
+
+    Parameters
+    ----------
+    config : str | Path | None
+        Path to a config.yml file, or None for default CONFIG_FILE.
+    resources : str | Path | None
+        Path to a resources.yml file, or None for default RESOURCES_FILE.
+
+    Returns
+    -------
+    list[Path]
+        Paths of the written snapshots.
+    """
+    resources = resources or RESOURCES_FILE
+    usernames = load_resources(resources)['path_map'].keys()
+    return [save_config_snapshot(config, resources, username=u) for u in usernames]
+
+@startup_profiler.profile('config snapshot')
+def load_config_snapshot(config=None, resources=None, **kwargs):
+    """
+    Load the resolved configuration from its binary snapshot.
+
+    The snapshot is used if it was built from the current contents of
+    `config` and `resources` (and, if it contains relative paths, from the
+    same working directory). Otherwise it is rebuilt and saved transparently.
+
+    Parameters
+    ----------
+    config : str | Path | None
+        Path to a config.yml file, or None for default CONFIG_FILE.
+    resources : str | Path | None
+        Path to a resources.yml file, or None for default RESOURCES_FILE.
+    **kwargs
+        Passed to get_username (username, mn5_user).
+
+    Returns
+    -------
+    dict
+        Configuration dictionary with absolute paths resolved.
+    """
+    config = config or CONFIG_FILE
+    resources = resources or RESOURCES_FILE
+    username = get_username(**kwargs)
+    file = config_snapshot_file(config, username)
+
+    try:
+        with file.open('rb') as f:
+            snapshot = pickle.load(f)
+        if (snapshot['digest'] == _snapshot_digest(config, resources, username)
+            and snapshot['cwd'] in (None, os.getcwd())):
+            return snapshot['config']
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError):
+        # missing or unreadable snapshot; rebuild it below
+        pass
+
+    snapshot = _build_config_snapshot(config, resources, username)
+    try:
+        _write_snapshot(snapshot, file)
+    except OSError:
+        # e.g. read-only file system; the resolved config is still valid
+        pass
+    return snapshot['config']
+
+def _file_fingerprint(file):
+    """(mtime, size) of a file, used to detect when a cached entry is stale."""
+    st = os.stat(file)
+    return (st.st_mtime_ns, st.st_size)
+
+def _cached(kind, files, username, build):
+    """
+    Return a cached, frozen result of `build()` for the given files + user.
+
+    The cache key includes the working directory because relative
+    paths are resolved against it.
+    """
+    files = tuple(os.path.abspath(f) for f in files)
+    try:
+        fingerprint = tuple(_file_fingerprint(f) for f in files)
+    except FileNotFoundError:
+        # let the loader raise its usual error
+        return build()
+
+    key = (kind, files, username, os.getcwd())
+    entry = _CACHE.get(key)
+    if entry is not None:
+        if entry[0] == fingerprint:
+            _CACHE_STATS['hits'] += 1
+            return entry[1]
+        _CACHE_STATS['invalidations'] += 1
+
+    _CACHE_STATS['misses'] += 1
+    value = freeze(build())
+    _CACHE[key] = (fingerprint, value)
+    return value
+
+def cache_stats():
+    """
+    Statistics of the load_paths / load_config cache.
+
+    Returns
+    -------
+    dict[str, int]
+        Number of cache 'hits', 'misses', 'invalidations' (entries reloaded
+        because a file changed) and current number of entries ('size').
+    """
+    return {'hits': _CACHE_STATS['hits'],
+            'misses': _CACHE_STATS['misses'],
+            'invalidations': _CACHE_STATS['invalidations'],
+            'size': len(_CACHE)}
+
+def clear_cache():
+    """
+    Empty the load_paths / load_config cache and reset its statistics.
+    """
+    _CACHE.clear()
+    _CACHE_STATS.clear()
+
 def fmt_path_map_key(k: str) -> str:
     """Format a key for placeholder substitution in config files.
        This can be changed if we ever decide to update the format"""
@@ -174,7 +991,7 @@ def get_path_map(resources=None, **kwargs):
     resources : str | Path | dict | None
         Path to a resources.yml file, a dict, or None for default RESOURCES_FILE.
     **kwargs
-        Passed to load_paths (e.g., username, mn5_user).
+        Passed to load_paths (e.g., username, mn5_user, cache).
 
     Returns
     -------
@@ -250,9 +1067,61 @@ def construct_templated_paths(path_map, base_path, user_alias, username, proj_na
 
     return path_map
 
-def generate_path_map(setup_settings, proj_name):
+def _user_paths(user_alias, system_name, system_info, mn5_locs, proj_name):
     """
-    Build a path map for all users based on setup_settings.
+    Paths for one user alias on one system.
+
+    Returns
+    -------
+    dict[str, str]
+        Mapping of *_dir keys to path strings.
+    """
+    username = system_info["username"]
+    path_map = {username: {}}
+
+    # Start with paths directly supplied in the YAML for *_dir
+    for k, v in system_info.items():
+        if k.endswith("_dir"):
+            path_map[username][k] = Path(v)
+
+    # determine project base path
+    if system_name == "mn5":
+        base_path = Path(mn5_locs["projects_dir"])
+        # also store scratch_dir and projects_dir explicitly
+        for k in ["projects_dir", "scratch_dir", "data_dir"]:
+            path_map[username][k] = Path(mn5_locs[k])
+    else:
+        base_path = Path(system_info["projects_dir"])
+
+    # Add deterministic templated directories
+    path_map = construct_templated_paths(
+        path_map,
+        base_path,
+        user_alias,
+        username,
+        proj_name
+    )
+
+    # Convert all Path objects to strings (construct_templated_paths still returns Paths)
+    return {k: str(v) for k, v in path_map[username].items()}
+
+def _user_settings_digest(user_alias, system_name, system_info, mn5_locs, proj_name):
+    """Hash of everything a user's paths on one system are computed from."""
+    settings = (user_alias, system_name, sorted(system_info.items()),
+                sorted(mn5_locs.items()) if system_name == "mn5" else None,
+                proj_name)
+    return hashlib.sha1(repr(settings).encode()).hexdigest()[:16]
+
+def generate_user_index(setup_settings, proj_name, index=None, path_map=None):
+    """
+    Build (or incrementally update) the index of usernames and the path map.
+
+    The index maps each system username to the user alias and system it
+    belongs to, so that identifying the current user and system is a single
+    lookup, plus a digest of the settings the user's paths are computed from.
+    Given the previous index and path map, only the users whose settings
+    changed (or that are new) have their paths recomputed. The 'mn5_user'
+    entries are copies of the last mn5 user's.
 
     Parameters
     ----------
@@ -260,13 +1129,21 @@ def generate_path_map(setup_settings, proj_name):
         Dictionary containing 'users' and system-specific locations.
     proj_name : str
         Name of the project.
+    index : dict | None
+        Previous index (e.g. 'user_index' in resources.yml). Not modified.
+    path_map : dict | None
+        Previous path map, matching `index` (e.g. 'path_map' in resources.yml).
 
     Returns
     -------
-    dict[str, dict[str, str]]
-        path_map with username keys mapping to their paths.
+    index : dict[str, dict]
+        Mapping of username -> {'alias': str, 'system': str, 'digest': str}.
+    path_map : dict[str, dict[str, str]]
+        Mapping of username -> paths.
     """
-    path_map = defaultdict(dict)
+    old_index = index or {}
+    old_path_map = path_map or {}
+    index, path_map = {}, {}
 
     users = setup_settings.get("users", {})
     mn5_locs = setup_settings.get("mn5_locs", {})
@@ -274,50 +1151,180 @@ def generate_path_map(setup_settings, proj_name):
     for user_alias, systems in users.items():
         for system_name, system_info in systems.items():
             username = system_info["username"]
-
-            # Start with paths directly supplied in the YAML for *_dir
-            for k, v in system_info.items():
-                if k.endswith("_dir"):
-                    path_map[username][k] = Path(v)
-
-            # determine project base path
-            if system_name == "mn5":
-                base_path = Path(mn5_locs["projects_dir"])
-                # also store scratch_dir and projects_dir explicitly
-                for k in ["projects_dir", "scratch_dir", "data_dir"]:
-                    path_map[username][k] = Path(mn5_locs[k])
+            entry = {'alias': user_alias,
+                     'system': system_name,
+                     'digest': _user_settings_digest(user_alias, system_name, system_info,
+                                                     mn5_locs, proj_name)}
+            if old_index.get(username) == entry and username in old_path_map:
+                paths = old_path_map[username]
             else:
-                base_path = Path(system_info["projects_dir"])
-
-            # Add deterministic templated directories
-            path_map = construct_templated_paths(
-                path_map,
-                base_path,
-                user_alias,
-                username,
-                proj_name
-            )
+                paths = _user_paths(user_alias, system_name, system_info,
+                                    mn5_locs, proj_name)
+            index[username] = entry
+            path_map[username] = paths
+
+    # canonical mn5_user copy of the last mn5 user
+    mn5_usernames = [i["username"]
+                     for systems in users.values()
+                     for system_name, i in systems.items() if system_name == "mn5"]
+    if mn5_usernames:
+        last = mn5_usernames[-1]
+        index["mn5_user"] = dict(index[last])
+        path_map["mn5_user"] = dict(path_map[last])
+
+    return index, path_map
+
+def generate_path_map(setup_settings, proj_name):
+    """
+    Build a path map for all users based on setup_settings.
 
-            # Optionally add a canonical mn5_user copy
-            if system_name == "mn5":
-                path_map["mn5_user"] = copy.deepcopy(path_map[username])
+    Parameters
+    ----------
+    setup_settings : dict
+        Dictionary containing 'users' and system-specific locations.
+    proj_name : str
+        Name of the project.
 
-        # Convert all Path objects to strings (construct_templated_paths still returns Paths)
-    path_map_str = {
-        user: {k: str(v) for k, v in paths.items()} for user, paths in path_map.items()
-    }
+    Returns
+    -------
+    dict[str, dict[str, str]]
+        path_map with username keys mapping to their paths.
+    """
+    return generate_user_index(setup_settings, proj_name)[1]
+
+def lookup_user(username=None, resources=None, mn5_user=False):
+    """
+    Find which user alias and system a username belongs to.
+
+    Parameters
+    ----------
+    username : str | None
+        Username to look up. If None, the current system user.
+    resources : str | Path | dict | None
+        Path to a resources.yml file, a dict, or None for default RESOURCES_FILE.
+        Must contain the 'user_index' written by setup_project / add_new_users.
+    mn5_user : bool, default False
+        If True, look up 'mn5_user'.
+
+    Returns
+    -------
+    dict
+        {'alias': str, 'system': str, 'paths': dict[str, str]}
+    """
+    username = get_username(username, mn5_user)
+    resources = load_resources(resources)
+    index = resources.get('user_index')
+
+    if index is None:
+        raise ValueError(
+            "No user_index found in resources. "
+            "Run add_new_users.py to generate it."
+        )
+    if username not in index:
+        raise ValueError(
+            f"Username {username} not found in resources. "
+            f"Available: {list(index.keys())}"
+        )
+    entry = index[username]
+    path_map = resources.get('path_map', {})
+    if username not in path_map:
+        raise ValueError(
+            f"Username {username} is in the user_index but not in the path_map. "
+            "Run add_new_users.py to regenerate them."
+        )
+    return {'alias': entry['alias'], 'system': entry['system'],
+            'paths': path_map[username]}
+
+def is_path_like(s):
+    """
+    Whether a config string could be a path that needs resolving.
+
+    Strings without a path separator (names, labels, numbers),
+    URLs, and multi-line strings are clearly not paths.
+    """
+    return bool(s) and '/' in s and '://' not in s and '\n' not in s
+
+def resolve_paths(paths, max_workers=None):
+    """
+    Resolve symlinks and relative components for many paths at once.
+
+    Paths are grouped by their parent directory, and each distinct parent is
+    resolved only once. Every leaf under it then only needs a single `lstat`
+    to check whether the final component is itself a symlink. The result is
+    the same as calling `Path(p).resolve()` on each path.
 
-    return path_map_str
+    Parameters
+    ----------
+    paths : iterable of str
+        Paths to resolve. Duplicates are only resolved once.
+    max_workers : int | None
+        If > 1, resolve the distinct parent directories in parallel
+        with a thread pool of this size.
 
-def resolve_config_symlinks(d):
+    Returns
+    -------
+    dict[str, str]
+        Mapping of each input path to its resolved absolute path.
+    """
+    by_parent = defaultdict(list)
+    whole = []
+    for p in set(paths):
+        parent, name = os.path.split(p)
+        if name in ('', '.', '..'):
+            # nothing to reuse the parent for; resolve as is
+            whole.append(p)
+        else:
+            by_parent[parent or '.'].append((p, name))
+
+    def resolve_group(parent):
+        resolved_parent = str(Path(parent).resolve())
+        out = {}
+        for p, name in by_parent[parent]:
+            leaf = os.path.join(resolved_parent, name)
+            out[p] = str(Path(leaf).resolve()) if os.path.islink(leaf) else leaf
+        return out
+
+    resolved = {p: str(Path(p).resolve()) for p in whole}
+    if max_workers and max_workers > 1 and len(by_parent) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for out in pool.map(resolve_group, by_parent):
+                resolved.update(out)
+    else:
+        for parent in by_parent:
+            resolved.update(resolve_group(parent))
+
+    return resolved
+
+def _iter_strings(d):
+    """Yield every string within a nested data structure."""
+    if isinstance(d, dict):
+        for v in d.values():
+            yield from _iter_strings(v)
+    elif isinstance(d, list):
+        for item in d:
+            yield from _iter_strings(item)
+    elif isinstance(d, str):
+        yield d
+
+@startup_profiler.profile('symlink resolution')
+def resolve_config_symlinks(d, skip_non_paths=True, max_workers=None):
     """
     Recursively resolve symlinks and relative paths in the
     config dictionary.
 
+    All string leaves are resolved in one batch with `resolve_paths`,
+    so each distinct directory is only resolved once.
+
     Parameters
     ----------
     d : dict
         Configuration dictionary
+    skip_non_paths : bool, default True
+        If True, leave strings that are clearly not paths
+        (see `is_path_like`) untouched.
+    max_workers : int | None
+        If > 1, resolve paths in parallel with a thread pool of this size.
 
     Returns
     -------
@@ -325,16 +1332,64 @@ def resolve_config_symlinks(d):
         Configuration dictionary with symlinks and any
         relative paths resolved
     """
+    paths = _iter_strings(d)
+    if skip_non_paths:
+        paths = filter(is_path_like, paths)
+    resolved = resolve_paths(paths, max_workers=max_workers)
+
+    return _map_strings(d, lambda s: resolved.get(s, s))
+
+def _map_strings(d, fn):
+    """
+    Recursively apply `fn` to every string within a nested data structure.
+
+    Dicts and lists are rebuilt; all other types are left untouched.
+    """
     if isinstance(d, dict):
-        return {key: resolve_config_symlinks(item) for key, item in d.items()}
+        return {k: _map_strings(v, fn) for k, v in d.items()}
     elif isinstance(d, list):
-        return [resolve_config_symlinks(item) for item in d]
+        return [_map_strings(item, fn) for item in d]
     elif isinstance(d, str):
-        d = str(Path(d).resolve())
-        return d
+        return fn(d)
     else:
-        return d
+        return d  # leave numbers, bools, None, etc. untouched
+
+@functools.lru_cache(maxsize=32)
+def _compile_substitutions(items):
+    m = dict(items)
+    if not m:
+        return lambda s: s
+
+    # longest keys first so that a key that is a prefix of another never wins
+    keys = sorted(m, key=len, reverse=True)
+    pattern = re.compile('|'.join(re.escape(k) for k in keys))
+    repl = lambda match: m[match.group(0)]
+
+    return lambda s: pattern.sub(repl, s)
 
+def compile_substitutions(m):
+    """
+    Compile a substring mapping into a single-pass substitution function.
+
+    All keys are combined into one regular expression, so each string is
+    rewritten in a single scan regardless of the number of keys. When keys
+    overlap, the longest one wins, and replaced text is never re-scanned.
+    Compiled functions are cached, so compiling the same mapping again is free.
+
+    Parameters
+    ----------
+    m : dict[str, str]
+        Mapping of substrings to find to their replacements
+        (e.g. the output of get_path_map).
+
+    Returns
+    -------
+    callable
+        Function taking a string and returning it with all substitutions applied.
+    """
+    return _compile_substitutions(frozenset(m.items()))
+
+@startup_profiler.profile('substitution')
 def replace_str_dict(d, m):
     """
     Recursively replace substrings in all strings within a nested data structure.
@@ -342,8 +1397,10 @@ def replace_str_dict(d, m):
     Args:
         d (dict, list, str, or other): The data structure to process. Can be a dictionary,
             list, string, or any other type. Nested dictionaries and lists are supported.
-        m (dict): A mapping of substrings to replace, where keys are substrings to find
-            and values are the replacements.
+        m (dict or callable): A mapping of substrings to replace, where keys are substrings
+            to find and values are the replacements, or a function returned by
+            compile_substitutions. Each string is rewritten in a single pass; when keys
+            overlap, the longest one wins.
 
     Returns:
         Same type as input `d`: A new data structure with all string occurrences of the
@@ -355,17 +1412,135 @@ def replace_str_dict(d, m):
         >>> replace_str_dict(data, mapping)
         {'path': '/mnt/data/data', 'files': ['file1.txt', 'file2.txt']}
     """
-    if isinstance(d, dict):
-        return {k: replace_str_dict(v, m) for k, v in d.items()}
-    elif isinstance(d, list):
-        return [replace_str_dict(item, m) for item in d]
-    elif isinstance(d, str):
-        for old, new in m.items():
-            d = d.replace(old, new)
-        return d
-    else:
-        return d  # leave numbers, bools, None, etc. untouched
+    sub = m if callable(m) else compile_substitutions(m)
+    return _map_strings(d, sub)
+
+def _relpath(target, start):
+    """
+    os.path.relpath for normalized, relative paths, without
+    touching the file system (no getcwd / abspath).
+    """
+    t = [] if target == '.' else target.split('/')
+    s = [] if start == '.' else start.split('/')
+    i = 0
+    while i < min(len(t), len(s)) and t[i] == s[i]:
+        i += 1
+    return '/'.join(['..'] * (len(s) - i) + t[i:]) or '.'
+
+class PathIndex:
+    """
+    Index of repository paths (relative to the repo root) for
+    constant-time lookups of paths written relative to any directory.
+
+    Parameters
+    ----------
+    files : iterable of str
+        Normalized paths of files (e.g. from `git ls-files`).
+    dirs : iterable of str
+        Normalized paths of directories (without trailing '/').
+
+    Examples
+    --------
+    >>> index = PathIndex(['analysis/x.py'], ['analysis'])
+    >>> index.lookup('x.py', start='analysis')
+    'analysis/x.py'
+    >>> index.lookup('../analysis/', start='resources')
+    'analysis'
+    """
+    def __init__(self, files, dirs=()):
+        self.dirs = set(dirs) - {'.'}
+        self.files = set(files) - self.dirs - {'.'}
+        self.paths = self.files | self.dirs
+
+    def __len__(self):
+        return len(self.paths)
+
+    def is_dir(self, path):
+        """Whether an indexed repo path is a directory."""
+        return path in self.dirs
+
+    def lookup(self, path, start='.'):
+        """
+        Repo path that `path`, written relative to `start`, refers to.
+
+        Only the canonical spelling of a relative path matches (the one
+        os.path.relpath would give, e.g. 'x.py' rather than './x.py'),
+        optionally with a trailing '/' for directories.
+
+        Parameters
+        ----------
+        path : str
+            Path as written, relative to `start`.
+        start : str
+            Directory the path is relative to, relative to the repo root.
+
+        Returns
+        -------
+        str | None
+            The indexed repo path, or None if `path` is not indexed.
+        """
+        is_dir = path.endswith('/')
+        rel = path[:-1] if is_dir else path
+        if not rel or rel.startswith('/'):
+            return None
+
+        target = os.path.normpath(os.path.join(start, rel))
+        if _relpath(target, os.path.normpath(start)) != rel:
+            return None
+
+        if target in (self.dirs if is_dir else self.paths):
+            return target
+        return None
+
+# git mode of submodules (gitlinks), which are directories in the work tree
+_GITLINK_MODE = '160000'
+
+def repo_snapshot(wd='.', exclude=()):
+    """
+    Index of the paths tracked by git, from a single `git ls-files` call.
+
+    Directories are derived from the tracked paths (every ancestor of a
+    tracked file, and submodules), so no stat calls are made.
 
+    Parameters
+    ----------
+    wd : str
+        Directory to list; paths are relative to it.
+    exclude : iterable of str
+        Tracked files to leave out.
+
+    Returns
+    -------
+    PathIndex
+        Tracked files in `.files`, directories in `.dirs`.
+    """
+    import subprocess
+    out = subprocess.run(['git', 'ls-files', '--stage', '-z'], cwd=wd,
+                         capture_output=True, check=True).stdout
+    exclude = set(exclude)
+
+    files = set()
+    dirs = set()
+    for entry in out.decode('utf-8', 'surrogateescape').split('\0'):
+        if not entry:
+            continue
+        # <mode> <object> <stage>\t<path>
+        meta, path = entry.split('\t', 1)
+        if path in exclude:
+            continue
+        if meta.startswith(_GITLINK_MODE):
+            dirs.add(path)
+        else:
+            files.add(path)
+
+        parent = os.path.dirname(path)
+        while parent and parent not in dirs:
+            dirs.add(parent)
+            parent = os.path.dirname(parent)
+
+    return PathIndex(files, dirs)
+
+@metrics.timed('run_cmd')
 def run_cmd(cmd, wd='.', shell=False):
     """
     Run a shell command using subprocess and return its output.
@@ -391,19 +1566,21 @@ def run_cmd(cmd, wd='.', shell=False):
         If the command exits with a non-zero status, the error message
         and stderr are raised.
     """
+    import subprocess
     # Split string into args safely
     if isinstance(cmd, str) and not shell:
         cmd = cmd.split()
 
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True,
-            cwd=wd,
-            shell=shell
-        )
+        with metrics.command(cmd):
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=wd,
+                shell=shell
+            )
         return result.stdout
     except subprocess.CalledProcessError as e:
         print("Error while running command:")
@@ -427,6 +1604,237 @@ def safe_run(cmd, dry_run=True, **kwargs):
     else:
         return run_cmd(cmd, **kwargs)
 
+def run_jobs(fn, items, jobs=None):
+    """
+    Call `fn(item)` for every item, optionally in a thread pool, and
+    collect the errors instead of stopping at the first one.
+
+    Parameters
+    ----------
+    fn : callable
+        Function to call on each item.
+    items : iterable
+        Items to process.
+    jobs : int | None
+        Number of threads. If None or <= 1, items are processed
+        one after the other, in order.
+
+    Returns
+    -------
+    dict
+        Mapping of each item that failed to the exception it raised,
+        in the order of `items`.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    items = list(items)
+    errors = {}
+    if not jobs or jobs <= 1:
+        for item in items:
+            try:
+                fn(item)
+            except Exception as e:
+                errors[item] = e
+        return errors
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(fn, item) for item in items]
+        for item, future in zip(items, futures):
+            try:
+                future.result()
+            except Exception as e:
+                errors[item] = e
+    return errors
+
+def format_job_errors(errors, action):
+    """
+    Format the errors returned by run_jobs as a single report.
+
+    Parameters
+    ----------
+    errors : dict
+        Output of run_jobs.
+    action : str
+        What was being done, e.g. 'add new users'.
+
+    Returns
+    -------
+    str
+    """
+    lines = [f"Failed to {action} for {len(errors)} item(s):"]
+    lines += [f"- {item}: {type(e).__name__}: {e}" for item, e in errors.items()]
+    return '\n'.join(lines)
+
+def _git_ignored(src):
+    """
+    Paths under `src` ignored by git, relative to `src`
+    (directories with a trailing '/'). Empty if `src` is not in a git repo.
+    """
+    import subprocess
+    cmd = ['git', 'ls-files', '--others', '--ignored', '--exclude-standard',
+           '--directory', '-z']
+    try:
+        with metrics.command(cmd):
+            out = subprocess.run(cmd, cwd=src, capture_output=True, text=True, check=True).stdout
+    except (subprocess.CalledProcessError, OSError):
+        return set()
+    return set(p for p in out.split('\0') if p)
+
+# ioctl request number to clone a file (copy-on-write) on Linux
+_FICLONE = 0x40049409
+
+def _reflink(src, dst):
+    """Clone `src` to `dst` with copy-on-write; raises OSError if unsupported."""
+    import shutil
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+@metrics.timed('copy_tree')
+def copy_tree(src, dst, jobs=None, link=None, skip_ignored=False, dry_run=True):
+    """
+    Copy a directory tree, copying files in parallel with a thread pool.
+
+    Like shutil.copytree, `dst` must not exist yet and symlinks are followed.
+
+    Parameters
+    ----------
+    src : str | Path
+        Directory to copy.
+    dst : str | Path
+        Destination directory.
+    jobs : int | None
+        Number of copy threads. If None, the ThreadPoolExecutor default.
+    link : {None, 'hardlink', 'reflink'}
+        - None: copy all files.
+        - 'hardlink': hard link git objects (`.git/objects/`, which git never
+          modifies) instead of copying them; copy everything else.
+        - 'reflink': clone all files copy-on-write where the file system
+          supports it (e.g. btrfs, XFS); copy otherwise.
+    skip_ignored : bool, default False
+        If True, skip files and directories ignored by git in `src`.
+    dry_run : bool
+        If True, nothing is copied; the operation is logged.
+
+    Returns
+    -------
+    dict | None
+        Copy statistics ('files', 'bytes', 'linked', 'skipped', 'seconds',
+        'mb_per_s'), or None in dry-run mode.
+    """
+    import shutil
+    from concurrent.futures import ThreadPoolExecutor
+    if dry_run:
+        print(f"[DRY-RUN] Would copy {src} -> {dst}")
+        return None
+
+    if link not in (None, 'hardlink', 'reflink'):
+        raise ValueError(f"link must be None, 'hardlink' or 'reflink', got {link!r}")
+
+    start = time.perf_counter()
+    src, dst = Path(src), Path(dst)
+    ignored = _git_ignored(src) if skip_ignored else set()
+    stats = Counter(files=0, bytes=0, linked=0, skipped=0)
+    copied = 0
+
+    # create the directory structure and collect the files to copy
+    os.makedirs(dst)
+    dirs, files = [], []
+    for root, dirnames, filenames in os.walk(src, followlinks=True):
+        rel_root = os.path.relpath(root, src)
+        rel = lambda name: name if rel_root == '.' else f'{rel_root}/{name}'
+
+        kept = [d for d in dirnames if f'{rel(d)}/' not in ignored]
+        stats['skipped'] += len(dirnames) - len(kept)
+        dirnames[:] = kept
+        for d in dirnames:
+            (dst / rel(d)).mkdir()
+            dirs.append(rel(d))
+
+        for f in filenames:
+            if rel(f) in ignored:
+                stats['skipped'] += 1
+            else:
+                files.append(rel(f))
+
+    reflink_ok = [link == 'reflink']
+
+    def copy_file(rel_path):
+        s, d = src / rel_path, dst / rel_path
+        if link == 'hardlink' and rel_path.startswith('.git/objects/'):
+            try:
+                os.link(s, d)
+                return os.path.getsize(s), True
+            except OSError:
+                pass  # e.g. different file system
+        elif reflink_ok[0]:
+            try:
+                _reflink(s, d)
+                return os.path.getsize(s), True
+            except (OSError, ImportError):
+                reflink_ok[0] = False  # unsupported here; stop trying
+        shutil.copy2(s, d)
+        return os.path.getsize(d), False
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for size, linked in pool.map(copy_file, files):
+            stats['files'] += 1
+            stats['bytes'] += size
+            stats['linked'] += linked
+            copied += 0 if linked else size
+    metrics.add_bytes('copy_tree', read=copied, written=copied)
+
+    # match copytree: directories get their source metadata
+    for d in dirs:
+        shutil.copystat(src / d, dst / d)
+    shutil.copystat(src, dst)
+
+    seconds = time.perf_counter() - start
+    stats = dict(stats, seconds=seconds,
+                 mb_per_s=stats['bytes'] / 1e6 / seconds if seconds else 0.0)
+    print(f"Copied {src} -> {dst}: {stats['files']} files "
+          f"({stats['bytes'] / 1e6:.1f} MB, {stats['linked']} linked, "
+          f"{stats['skipped']} skipped) in {seconds:.2f}s "
+          f"({stats['mb_per_s']:.1f} MB/s)")
+    return stats
+
+def profile_startup(start=None, file=None):
+    """
+    Print how long each phase of the template header took, if the
+    PROJ_PROFILE_STARTUP environment variable is set.
+
+    Parameters
+    ----------
+    start : float | None
+        time.perf_counter() at the top of the header. The time until this
+        module started importing is counted as root discovery.
+    file : file-like | None
+        Where to print the report; defaults to sys.stderr.
+
+    Returns
+    -------
+    dict[str, float] | None
+        Seconds per phase, plus 'other' and 'total', or None if not enabled.
+    """
+    if not startup_profiler.enabled:
+        return None
+
+    end = time.perf_counter()
+    phases = {'root discovery': 0.0, 'imports': _IMPORT_SECONDS}
+    # the header's own lookup (before the import) plus find_project_root's
+    if start is not None:
+        phases['root discovery'] += _IMPORT_START - start
+    for phase, seconds in startup_profiler.seconds.items():
+        phases[phase] = phases.get(phase, 0.0) + seconds
+    total = end - (_IMPORT_START if start is None else start)
+    phases['other'] = max(total - sum(phases.values()), 0.0)
+    phases['total'] = total
+
+    lines = [f'Startup profile ({PROFILE_STARTUP_ENV}):']
+    lines += [f'  {phase:<20} {sec * 1000:9.1f} ms' for phase, sec in phases.items()]
+    print('\n'.join(lines), file=file or sys.stderr)
+    return phases
+
 def save_mn5_config():
     """
     Save a version of the project configuration with absolute paths for MN5.
@@ -439,9 +1847,12 @@ def save_mn5_config():
     -------
     None
     """
-    config = load_config(mn5_user=True)
+    config = load_config(mn5_user=True, cache=False, snapshot=False)
 
     config_file = MN5_CONFIG_FILE
 
     with open(config_file, 'w') as f:
-        yaml.dump(config, f, default_flow_style=False)
+        dump_yml(config, f, default_flow_style=False)
+
+# time taken to import this module, for profile_startup
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
@@ -0,0 +1,102 @@
+# Benchmark of the README link matcher: the previous approach (os.path.relpath of
+# every tracked path for every README, then a list membership test per token)
+# against a PathIndex built once.
+#
+#     Usage: python -m template_user.tests.benchmarks.bench_readme_paths
+#            (run from the parent directory, like the pytest suite)
+
+import argparse
+import os
+import random
+import time
+
+from template_user.resources import utils
+
+def make_repo(n_files=10_000, n_readmes=500, seed=0):
+    """
+    Synthetic tracked file list with `n_readmes` READMEs spread over
+    nested directories.
+
+    Returns
+    -------
+    files : list of str
+    dirs : list of str
+    md_files : list of str
+    """
+    rng = random.Random(seed)
+    dirs = ['.']
+    while len(dirs) < n_readmes:
+        parent = rng.choice(dirs)
+        d = f'd{len(dirs)}' if parent == '.' else f'{parent}/d{len(dirs)}'
+        dirs.append(d)
+
+    md_files = ['README.md' if d == '.' else f'{d}/README.md' for d in dirs]
+    files = list(md_files)
+    while len(files) < n_files:
+        d = rng.choice(dirs)
+        files.append(f'f{len(files)}.txt' if d == '.' else f'{d}/f{len(files)}.txt')
+
+    return files, [d for d in dirs if d != '.'], md_files
+
+def make_tokens(md_file, files, n_tokens=50, seed=0):
+    """Mix of paths relative to the README (hits) and words (misses)."""
+    rng = random.Random(f'{seed}{md_file}')
+    md_dir = os.path.dirname(md_file) or '.'
+    tokens = []
+    for i in range(n_tokens):
+        if i % 2:
+            tokens.append(os.path.relpath(rng.choice(files), md_dir))
+        else:
+            tokens.append(f'word{i}')
+    return tokens
+
+def legacy_matches(files, dirs, md_files, tokens):
+    """Previous approach: relpath of every path for every README."""
+    entries = files + dirs
+    out = []
+    for md_file in md_files:
+        md_dir = os.path.dirname(md_file) or '.'
+        rel_files = [os.path.relpath(f, md_dir) for f in entries]
+        out.append([tok in rel_files for tok in tokens[md_file]])
+    return out
+
+def index_matches(files, dirs, md_files, tokens):
+    """PathIndex built once, one lookup per token."""
+    index = utils.PathIndex(files, dirs)
+    out = []
+    for md_file in md_files:
+        md_dir = os.path.dirname(md_file) or '.'
+        out.append([index.lookup(tok, md_dir) is not None for tok in tokens[md_file]])
+    return out
+
+def main(n_files=10_000, n_readmes=500, n_tokens=50):
+    files, dirs, md_files = make_repo(n_files, n_readmes)
+    tokens = {md: make_tokens(md, files, n_tokens) for md in md_files}
+
+    start = time.perf_counter()
+    legacy = legacy_matches(files, dirs, md_files, tokens)
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new = index_matches(files, dirs, md_files, tokens)
+    new_s = time.perf_counter() - start
+
+    assert legacy == new
+
+    print(f'{len(files)} files, {len(md_files)} READMEs, {n_tokens} tokens each')
+    print(f'  legacy relpath expansion: {legacy_s:.3f}s')
+    print(f'  PathIndex lookups:        {new_s:.3f}s ({legacy_s / new_s:.0f}x)')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark README path matching"
+    )
+    parser.add_argument("--files", type=int, default=10_000,
+                        help="Number of tracked files")
+    parser.add_argument("--readmes", type=int, default=500,
+                        help="Number of READMEs")
+    parser.add_argument("--tokens", type=int, default=50,
+                        help="Number of candidate tokens per README")
+    args = parser.parse_args()
+
+    main(n_files=args.files, n_readmes=args.readmes, n_tokens=args.tokens)
@@ -0,0 +1,76 @@
+# Benchmark of replace_str_dict against the previous implementation, which
+# called str.replace once per (placeholder, path) pair on every string.
+#
+#     Usage: python -m template_user.tests.benchmarks.bench_replace_str_dict
+#            (run from the parent directory, like the pytest suite)
+
+import argparse
+import time
+
+from template_user.resources import utils
+
+def legacy_replace_str_dict(d, m):
+    """replace_str_dict as it was before the single-pass engine."""
+    if isinstance(d, dict):
+        return {k: legacy_replace_str_dict(v, m) for k, v in d.items()}
+    elif isinstance(d, list):
+        return [legacy_replace_str_dict(item, m) for item in d]
+    elif isinstance(d, str):
+        for old, new in m.items():
+            d = d.replace(old, new)
+        return d
+    else:
+        return d
+
+def make_path_map(n_custom_dirs=20):
+    """Path map with the standard keys plus `n_custom_dirs` extra *_dir keys."""
+    keys = ['proj_data_dir', 'proj_ref_dir', 'proj_figures_dir', 'proj_metadata_dir',
+            'projects_dir', 'scratch_dir', 'data_dir']
+    keys += [f'custom{i}_dir' for i in range(n_custom_dirs)]
+    return {utils.fmt_path_map_key(k): f'/gpfs/projects/bsc83/{k}' for k in keys}
+
+def make_config(n_leaves=50_000, path_map=None, leaves_per_group=100):
+    """Nested config with `n_leaves` string leaves using the path map keys."""
+    placeholders = list(path_map or make_path_map())
+    config = {}
+    for i in range(n_leaves):
+        group = config.setdefault(f'group{i // leaves_per_group}', {})
+        p = placeholders[i % len(placeholders)]
+        group[f'leaf{i}'] = f'{p}/sample_{i}/file_{i}.bam'
+    return config
+
+def timeit(fn, repeat=3):
+    """Best wall time of `repeat` calls to fn."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(n_leaves=50_000, n_custom_dirs=20, repeat=3):
+    path_map = make_path_map(n_custom_dirs)
+    config = make_config(n_leaves, path_map)
+
+    assert legacy_replace_str_dict(config, path_map) == utils.replace_str_dict(config, path_map)
+
+    legacy = timeit(lambda: legacy_replace_str_dict(config, path_map), repeat)
+    new = timeit(lambda: utils.replace_str_dict(config, path_map), repeat)
+
+    print(f'{n_leaves} leaves, {len(path_map)} placeholders (best of {repeat})')
+    print(f'  legacy str.replace loop: {legacy:.3f}s')
+    print(f'  compiled single pass:    {new:.3f}s ({legacy / new:.1f}x)')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark placeholder substitution in config files"
+    )
+    parser.add_argument("--leaves", type=int, default=50_000,
+                        help="Number of string leaves in the synthetic config")
+    parser.add_argument("--custom-dirs", type=int, default=20,
+                        help="Number of extra *_dir keys in the path map")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of repetitions per implementation")
+    args = parser.parse_args()
+
+    main(n_leaves=args.leaves, n_custom_dirs=args.custom_dirs, repeat=args.repeat)
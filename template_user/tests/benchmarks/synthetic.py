@@ -0,0 +1,62 @@
+# Synthetic resources.yml / config.yml files for the benchmarks, shaped like
+# the ones setup_project.py writes (setup_settings + path_map + user_index).
+
+from template_user.resources import utils
+
+PROJ_NAME = 'bench_project'
+
+MN5_LOCS = {'projects_dir': '/gpfs/projects/bsc83/Projects',
+            'scratch_dir': '/gpfs/scratch/bsc83',
+            'data_dir': '/gpfs/projects/bsc83/Data'}
+
+def make_setup_settings(n_users=100, n_custom_dirs=2):
+    """setup_settings with `n_users` users, each on mn5 and a local system."""
+    users = {}
+    for i in range(n_users):
+        local = {'username': f'local{i}',
+                 'projects_dir': f'/home/user{i}/mounts/mn5/Projects',
+                 'scratch_dir': f'/home/user{i}/mounts/mn5/scratch',
+                 'data_dir': f'/home/user{i}/mounts/mn5/Data'}
+        for j in range(n_custom_dirs):
+            local[f'custom{j}_dir'] = f'/home/user{i}/mounts/mn5/Data/custom{j}'
+        users[f'user{i}'] = {'mn5': {'username': f'bsc{i:06d}'}, 'local': local}
+    return {'project_name': PROJ_NAME, 'users': users, 'mn5_locs': MN5_LOCS}
+
+def make_resources(n_users=100):
+    """resources dict as written by setup_project.py."""
+    setup_settings = make_setup_settings(n_users)
+    user_index, path_map = utils.generate_user_index(setup_settings, PROJ_NAME)
+    return {'setup_settings': setup_settings,
+            'path_map': path_map,
+            'user_index': user_index}
+
+def make_config(n_leaves=10_000, leaves_per_group=100, samples=100):
+    """Nested config with `n_leaves` string leaves using the path map keys."""
+    placeholders = [utils.fmt_path_map_key(k) for k in
+                    ['proj_data_dir', 'proj_ref_dir', 'proj_figures_dir',
+                     'proj_metadata_dir', 'scratch_dir', 'data_dir']]
+    config = {}
+    for i in range(n_leaves):
+        group = config.setdefault(f'group{i // leaves_per_group}', {})
+        p = placeholders[i % len(placeholders)]
+        group[f'leaf{i}'] = f'{p}/sample_{i % samples}/file_{i}.bam'
+    return config
+
+def write_files(tmp_dir, n_users=100, n_leaves=10_000):
+    """
+    Write config.yml and resources.yml to `tmp_dir`.
+
+    Returns
+    -------
+    config_file : Path
+    resources_file : Path
+    username : str
+        A local username of the last user.
+    """
+    config_file = tmp_dir / 'config.yml'
+    resources_file = tmp_dir / 'resources.yml'
+    with open(config_file, 'w') as f:
+        utils.dump_yml(make_config(n_leaves), f)
+    with open(resources_file, 'w') as f:
+        utils.dump_yml(make_resources(n_users), f)
+    return config_file, resources_file, f'local{n_users - 1}'
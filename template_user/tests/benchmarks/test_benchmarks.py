@@ -0,0 +1,146 @@
+# Benchmarks of the config/path helpers on synthetic resources.yml / config.yml
+# files (10-1000 users, 1k-100k leaves). Each case records the best wall time,
+# in units of a calibration loop so baselines carry over between machines,
+# and the peak memory traced by tracemalloc. A case fails when a metric
+# regresses past its baseline in baseline.json by more than the tolerance.
+#
+# Skipped unless PROJ_BENCHMARKS=1. Run from the parent directory:
+#
+#     PROJ_BENCHMARKS=1 python -m pytest -q -s template_user/tests/benchmarks
+#
+# Environment variables:
+#     PROJ_BENCHMARKS_UPDATE=1      rewrite baseline.json with this run's metrics
+#     PROJ_BENCHMARKS_TIME_TOL      allowed relative time regression (default 1.0, i.e. 2x)
+#     PROJ_BENCHMARKS_MEM_TOL       allowed relative memory regression (default 0.25)
+
+import gc
+import json
+import os
+import time
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+from template_user.resources import utils
+from template_user.tests.benchmarks import synthetic
+
+pytestmark = pytest.mark.skipif(not os.environ.get('PROJ_BENCHMARKS'),
+                                reason='set PROJ_BENCHMARKS=1 to run benchmarks')
+
+BASELINE_FILE = Path(__file__).parent / 'baseline.json'
+UPDATE = bool(os.environ.get('PROJ_BENCHMARKS_UPDATE'))
+TIME_TOL = float(os.environ.get('PROJ_BENCHMARKS_TIME_TOL', 1.0))
+MEM_TOL = float(os.environ.get('PROJ_BENCHMARKS_MEM_TOL', 0.25))
+# below these, differences are noise
+TIME_SLACK = 0.05
+MEM_SLACK_MB = 0.5
+
+USERS = [10, 100, 1000]
+LEAVES = [1_000, 10_000, 100_000]
+# (users, leaves) for the end-to-end load_config cases
+SIZES = list(zip(USERS, LEAVES))
+
+def _calibration_loop():
+    d = {f'key{i}': f'/some/path/{i}' for i in range(200_000)}
+    return sum(len(v) for v in d.values())
+
+def best_time(fn, repeat=3):
+    """Best wall time of `repeat` calls to fn, in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def peak_mb(fn):
+    """Peak memory allocated while calling fn, in MB."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+@pytest.fixture(scope='session')
+def time_unit():
+    """Seconds taken by the calibration loop on this machine."""
+    return best_time(_calibration_loop, repeat=5)
+
+@pytest.fixture(scope='session')
+def baseline():
+    """Baseline metrics; rewritten at the end of the session if PROJ_BENCHMARKS_UPDATE."""
+    if BASELINE_FILE.exists():
+        with open(BASELINE_FILE) as f:
+            metrics = json.load(f)
+    else:
+        metrics = {}
+    yield metrics
+    if UPDATE:
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(metrics, f, indent=1, sort_keys=True)
+            f.write('\n')
+
+@pytest.fixture
+def bench(baseline, time_unit):
+    """Time and trace fn, and check it against the baseline under `name`."""
+    def run(name, fn, repeat=3):
+        metrics = {'time': round(best_time(fn, repeat) / time_unit, 3),
+                   'peak_mb': round(peak_mb(fn), 2)}
+        print(f"\n{name}: {metrics['time']} time units, {metrics['peak_mb']} MB peak")
+
+        if UPDATE:
+            baseline[name] = metrics
+            return metrics
+
+        base = baseline.get(name)
+        if base is None:
+            pytest.skip(f'no baseline for {name} (run with PROJ_BENCHMARKS_UPDATE=1)')
+        assert metrics['time'] <= base['time'] * (1 + TIME_TOL) + TIME_SLACK, (
+            f"{name}: time regressed from {base['time']} to {metrics['time']} units")
+        assert metrics['peak_mb'] <= base['peak_mb'] * (1 + MEM_TOL) + MEM_SLACK_MB, (
+            f"{name}: peak memory regressed from {base['peak_mb']} to {metrics['peak_mb']} MB")
+        return metrics
+    return run
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    utils.clear_cache()
+    yield
+    utils.clear_cache()
+
+@pytest.mark.parametrize('n_users', USERS)
+def test_generate_path_map(bench, n_users):
+    setup_settings = synthetic.make_setup_settings(n_users)
+    bench(f'generate_path_map[users={n_users}]',
+          lambda: utils.generate_path_map(setup_settings, synthetic.PROJ_NAME))
+
+@pytest.mark.parametrize('n_users', USERS)
+def test_load_paths(bench, tmp_path, n_users):
+    _, resources_file, username = synthetic.write_files(tmp_path, n_users, n_leaves=10)
+    bench(f'load_paths[users={n_users}]',
+          lambda: utils.load_paths(resources_file, username=username, cache=False))
+
+@pytest.mark.parametrize('n_leaves', LEAVES)
+def test_replace_str_dict(bench, n_leaves):
+    config = synthetic.make_config(n_leaves)
+    path_map = utils.get_path_map(synthetic.make_resources(10), username='local0', cache=False)
+    bench(f'replace_str_dict[leaves={n_leaves}]',
+          lambda: utils.replace_str_dict(config, path_map))
+
+@pytest.mark.parametrize('n_leaves', LEAVES)
+def test_resolve_config_symlinks(bench, n_leaves):
+    path_map = utils.get_path_map(synthetic.make_resources(10), username='local0', cache=False)
+    config = utils.replace_str_dict(synthetic.make_config(n_leaves), path_map)
+    bench(f'resolve_config_symlinks[leaves={n_leaves}]',
+          lambda: utils.resolve_config_symlinks(config))
+
+@pytest.mark.parametrize('n_users, n_leaves', SIZES)
+def test_load_config(bench, tmp_path, n_users, n_leaves):
+    config_file, resources_file, username = synthetic.write_files(tmp_path, n_users, n_leaves)
+    bench(f'load_config[users={n_users},leaves={n_leaves}]',
+          lambda: utils.load_config(config_file, resources_file, username=username,
+                                    cache=False, snapshot=False))
@@ -0,0 +1,71 @@
+import subprocess
+import pytest
+
+pytest.importorskip("marko")
+
+from template_user.resources import add_links_to_readmes
+
+def run(cmd, cwd):
+    subprocess.run(cmd, cwd=cwd, shell=True, check=True)
+
+@pytest.fixture
+def readme_repo(tmp_path, monkeypatch):
+    """Small git repo whose READMEs mention (unlinked) tracked files."""
+    (tmp_path / "analysis" / "plots").mkdir(parents=True)
+    (tmp_path / "analysis" / "plots" / "fig.py").write_text("")
+    (tmp_path / "processing").mkdir()
+    (tmp_path / "processing" / "run.py").write_text("")
+    (tmp_path / "README.md").write_text("# Project\n\nSee analysis/ and processing/run.py.\n")
+    (tmp_path / "analysis" / "README.md").write_text("# Analysis\n\n* plots: figures\n")
+    (tmp_path / "processing" / "README.md").write_text("# Processing\n\nRun run.py\n")
+    run("git init -q", cwd=tmp_path)
+    run("git add .", cwd=tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def read_readmes(root):
+    return {str(p.relative_to(root)): p.read_text()
+            for p in sorted(root.rglob("README.md"))}
+
+def test_main_adds_links(readme_repo):
+    written = add_links_to_readmes.main()
+
+    assert written == ["README.md", "analysis/README.md", "processing/README.md"]
+    readmes = read_readmes(readme_repo)
+    assert "[`processing/run.py`](processing/run.py)" in readmes["README.md"]
+    assert "[plots](plots)" in readmes["analysis/README.md"]
+    assert "[`run.py`](run.py)" in readmes["processing/README.md"]
+
+def test_main_parallel_matches_serial(readme_repo):
+    add_links_to_readmes.main(jobs=1, full=True)
+    serial = read_readmes(readme_repo)
+
+    run("git checkout -- .", cwd=readme_repo)
+    add_links_to_readmes.main(jobs=2, full=True)
+
+    assert read_readmes(readme_repo) == serial
+
+def test_main_skips_unchanged(readme_repo):
+    add_links_to_readmes.main()
+    assert add_links_to_readmes.main() == []
+
+def test_main_sibling_change_reprocesses_parent_links(readme_repo):
+    analysis = readme_repo / "analysis" / "README.md"
+    analysis.write_text("# Analysis\n\nInput from ../processing/new.py\n")
+    run("git add .", cwd=readme_repo)
+    add_links_to_readmes.main()
+    assert "[`../processing/new.py`]" not in analysis.read_text()
+
+    # only processing/ changes, but analysis/README.md links into it
+    (readme_repo / "processing" / "new.py").write_text("")
+    run("git add .", cwd=readme_repo)
+    assert "analysis/README.md" in add_links_to_readmes.main()
+    assert "[`../processing/new.py`](../processing/new.py)" in analysis.read_text()
+
+def test_main_skips_readmes_of_other_subtrees(readme_repo):
+    add_links_to_readmes.main()
+    (readme_repo / "processing" / "new.py").write_text("")
+    run("git add .", cwd=readme_repo)
+    # the root README sees processing/, analysis/README.md does not
+    assert "analysis/README.md" not in add_links_to_readmes.main()
+    assert (readme_repo / ".readme_links_manifest.json").exists()
@@ -70,3 +70,60 @@ def test_git_commands_run_for_new_user(tmp_path, fake_resources, monkeypatch):
     git_cmds = [c[0][0] for c in mock_safe_run.call_args_list]
     assert any("git fetch origin" in c for c in git_cmds)
     assert any("git reset --hard" in c for c in git_cmds)
+
+def test_user_index_updated_incrementally(fake_resources, tmp_path, monkeypatch):
+    from template_user.resources import utils
+    index, path_map = utils.generate_user_index(fake_resources["setup_settings"], "demo_proj")
+    alice_paths = path_map["alice"]
+    fake_resources["user_index"] = index
+    fake_resources["path_map"] = path_map
+    fake_resources["setup_settings"]["users"]["charlie"] = {
+        "local": {"username": "charlie", "projects_dir": str(tmp_path / "proj_charlie")}
+    }
+
+    monkeypatch.setattr(add_new_users, "load_yml", lambda x: fake_resources)
+    monkeypatch.setattr(add_new_users, "safe_run", lambda cmd, **kwargs: "main")
+    outputs = add_new_users.main(dry_run=True, user_dir=tmp_path, resources="fake")
+
+    user_index = outputs[0]["user_index"]
+    assert user_index["charlie"]["alias"] == "charlie"
+    assert outputs[0]["path_map"]["alice"] is alice_paths
+    assert "charlie" in outputs[0]["path_map"]
+
+def test_shared_mode_fetches_once(tmp_path, fake_resources, monkeypatch):
+    for alias in ["charlie", "dana"]:
+        fake_resources["setup_settings"]["users"][alias] = {
+            "local": {"username": alias, "projects_dir": str(tmp_path / f"proj_{alias}")}
+        }
+
+    monkeypatch.setattr(add_new_users, "load_yml", lambda x: fake_resources)
+    mock_safe_run = Mock(return_value="main")
+    monkeypatch.setattr(add_new_users, "safe_run", mock_safe_run)
+
+    add_new_users.main(dry_run=True, user_dir=tmp_path, resources="fake", git_mode="shared")
+
+    git_cmds = [c[0][0] for c in mock_safe_run.call_args_list]
+    assert sum("git fetch origin" in c for c in git_cmds) == 1
+    assert sum("git clone --no-checkout" in c for c in git_cmds) == 2
+
+def test_errors_gathered_per_user(tmp_path, fake_resources, monkeypatch):
+    for alias in ["charlie", "dana"]:
+        fake_resources["setup_settings"]["users"][alias] = {
+            "local": {"username": alias, "projects_dir": str(tmp_path / f"proj_{alias}")}
+        }
+
+    called = []
+    def fake_safe_run(cmd, wd=None, **kwargs):
+        called.append(str(wd))
+        if str(wd).endswith("charlie"):
+            raise OSError("disk full")
+        return "main"
+
+    monkeypatch.setattr(add_new_users, "load_yml", lambda x: fake_resources)
+    monkeypatch.setattr(add_new_users, "safe_run", fake_safe_run)
+
+    with pytest.raises(RuntimeError, match="charlie: OSError: disk full"):
+        add_new_users.main(dry_run=True, user_dir=tmp_path, resources="fake", jobs=2)
+
+    # the other new user was still processed
+    assert any(wd.endswith("dana") for wd in called)
@@ -62,3 +62,85 @@ def test_add_users_real_git(tmp_path):
     for user in users:
         for k in expected:
             assert k in content['path_map'][user].keys()
+
+@pytest.fixture
+def local_project(tmp_path, monkeypatch):
+    """Project with one user (alice) cloned from a local bare 'remote'."""
+    for var in ["GIT_AUTHOR_NAME", "GIT_COMMITTER_NAME"]:
+        monkeypatch.setenv(var, "tester")
+    for var in ["GIT_AUTHOR_EMAIL", "GIT_COMMITTER_EMAIL"]:
+        monkeypatch.setenv(var, "tester@example.com")
+
+    remote = tmp_path / "remote.git"
+    run(f"git init -q --bare -b main {remote}", cwd=tmp_path)
+
+    project_dir = tmp_path / "proj1"
+    project_dir.mkdir()
+    user_dir = project_dir / "alice"
+    run(f"git clone -q {remote} {user_dir}", cwd=tmp_path)
+    (user_dir / "file.txt").write_text("hello")
+    run("git add . && git commit -q -m init && git push -q origin HEAD:main", cwd=user_dir)
+    run("git remote set-head origin main", cwd=user_dir)
+
+    resources = {
+        "setup_settings": {
+            "project_name": "proj1",
+            "users": {
+                "alice": {"local": {"username": "alice", "projects_dir": "/alice/proj/"}},
+                "bob": {"local": {"username": "bob", "projects_dir": "/bobuser/projects/"}},
+                "carol": {"local": {"username": "carol", "projects_dir": "/carol/projects/"}}},
+            },
+        "users": ['alice']
+    }
+    res_dir = user_dir / "resources"
+    res_dir.mkdir()
+    res_file = res_dir / "resources.yml"
+    with res_file.open("w") as f:
+        yaml.dump(resources, f)
+
+    return remote, user_dir, res_file
+
+@pytest.mark.parametrize("git_mode", ["shared", "worktree"])
+def test_add_users_shared_objects(local_project, git_mode):
+    remote, user_dir, res_file = local_project
+
+    add_new_users.main(dry_run=False, user_dir=user_dir, resources=res_file,
+                       git_mode=git_mode, jobs=2)
+
+    assert (user_dir.parent / "carol" / "file.txt").read_text() == "hello"
+    new_user_dir = user_dir.parent / "bob"
+    assert (new_user_dir / "file.txt").read_text() == "hello"
+
+    # resources.yml (untracked) was brought over with the new user
+    content = yaml.safe_load((new_user_dir / "resources/resources.yml").read_text())
+    assert "bob" in content["users"]
+
+    # no separate object store for the new user
+    if git_mode == "shared":
+        # hard linked, not borrowed through alternates
+        assert not (new_user_dir / ".git/objects/info/alternates").exists()
+        objects = [f for f in (new_user_dir / ".git/objects").rglob("*")
+                   if f.is_file() and "info" not in f.parts]
+        assert objects and all(f.stat().st_nlink > 1 for f in objects)
+        url = subprocess.run("git remote get-url origin", cwd=new_user_dir, shell=True,
+                             check=True, capture_output=True, text=True).stdout.strip()
+        assert url == str(remote)
+    else:
+        assert (new_user_dir / ".git").is_file()
+
+def test_add_users_shared_hides_local_branches(local_project):
+    remote, user_dir, res_file = local_project
+    # alice works on a local branch that was never pushed
+    run("git checkout -q -b alice-wip && git branch -q alice-old", cwd=user_dir)
+
+    add_new_users.main(dry_run=False, user_dir=user_dir, resources=res_file,
+                       git_mode="shared")
+
+    new_user_dir = user_dir.parent / "bob"
+    refs = subprocess.run("git for-each-ref --format='%(refname)'", cwd=new_user_dir,
+                          shell=True, check=True, capture_output=True, text=True).stdout.split()
+    assert "refs/heads/main" in refs
+    assert not [r for r in refs if "alice" in r]
+    branch = subprocess.run("git branch --show-current", cwd=new_user_dir, shell=True,
+                            check=True, capture_output=True, text=True).stdout.strip()
+    assert branch == "main"
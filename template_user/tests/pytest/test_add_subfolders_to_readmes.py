@@ -0,0 +1,77 @@
+import subprocess
+import pytest
+from pathlib import Path
+
+from template_user.resources import add_subfolders_to_readmes
+
+README = "# Analysis\n\n## Subfolder descriptions\n\n* [old](old/): old stuff\n\n## Other\n"
+
+@pytest.fixture
+def readme_dirs(tmp_path, monkeypatch):
+    for d in ("analysis", "processing"):
+        (tmp_path / d).mkdir()
+        (tmp_path / d / "README.md").write_text(README)
+        for sub in ("old", "new_a", "new_b", ".ipynb_checkpoints"):
+            (tmp_path / d / sub).mkdir()
+            (tmp_path / d / sub / "x.py").write_text("")
+    (tmp_path / "processing" / "rules").mkdir()
+    (tmp_path / "processing" / "rules" / "x.smk").write_text("")
+    # untracked folders are not listed
+    (tmp_path / "analysis" / "untracked").mkdir()
+    (tmp_path / "analysis" / "untracked" / "x.py").write_text("")
+    subprocess.run("git init -q && git add analysis/*/x.py processing analysis/README.md "
+                   "&& git rm -q --cached analysis/untracked/x.py",
+                   cwd=tmp_path, shell=True, check=True)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def test_add_subfolder_bullets_after_last_bullet():
+    lines = README.splitlines(keepends=True)
+    out = add_subfolders_to_readmes.add_subfolder_bullets(
+        lines, "## Subfolder descriptions", [Path("analysis/new")])
+
+    assert out[out.index("* [old](old/): old stuff\n") + 1] == "* [new](new/): # TODO!!\n"
+    assert out[-1] == "## Other\n"
+
+def test_add_subfolder_bullets_section_without_bullets():
+    lines = ["* [top](top/): before the section\n", "## Subfolder descriptions\n",
+             "\n", "Details here.\n", "\n", "## Other\n", "* [x](x/)\n"]
+    out = add_subfolders_to_readmes.add_subfolder_bullets(
+        lines, "## Subfolder descriptions", [Path("a"), Path("b")])
+
+    # at the end of the section, not after the bullet before it
+    assert out == lines[:5] + ["* [a](a/): # TODO!!\n", "* [b](b/): # TODO!!\n"] + lines[5:]
+
+def test_add_subfolder_bullets_section_at_end_of_file():
+    lines = ["## Subfolder descriptions\n", "* [old](old/)\n", "\n", "<!-- note -->\n"]
+    out = add_subfolders_to_readmes.add_subfolder_bullets(
+        lines, "## Subfolder descriptions", [Path("new")])
+
+    assert out == lines[:2] + ["* [new](new/): # TODO!!\n"] + lines[2:]
+
+def test_add_subfolder_bullets_no_section():
+    lines = ["# Title\n", "## Other\n"]
+    out = add_subfolders_to_readmes.add_subfolder_bullets(
+        lines, "## Subfolder descriptions", [Path("new")])
+
+    assert out == lines + ["* [new](new/): # TODO!!\n"]
+
+def test_mentioned_names():
+    lines = ["* [old](old/): see [other]\n", "<!-- * [dummy_analysis] -->\n", "no names\n"]
+    assert add_subfolders_to_readmes.mentioned_names(lines) == {"old", "other", "dummy_analysis"}
+
+def test_main_parallel_matches_serial(readme_dirs):
+    missing = add_subfolders_to_readmes.main(jobs=1)
+    serial = {d: (readme_dirs / d / "README.md").read_text()
+              for d in ("analysis", "processing")}
+    assert sorted(p.stem for p in missing) == ["new_a", "new_a", "new_b", "new_b"]
+    assert "rules" not in serial["processing"]
+    assert "untracked" not in serial["analysis"]
+
+    for d in serial:
+        (readme_dirs / d / "README.md").write_text(README)
+    add_subfolders_to_readmes.main(jobs=2)
+
+    assert {d: (readme_dirs / d / "README.md").read_text() for d in serial} == serial
+    # nothing left to add
+    assert add_subfolders_to_readmes.main(jobs=2) == []
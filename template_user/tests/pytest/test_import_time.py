@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from pathlib import Path
+
+USER_DIR = Path(__file__).resolve().parents[2]
+# cumulative import time budget per module, in milliseconds
+BUDGET_MS = float(os.environ.get("PROJ_IMPORT_BUDGET_MS", 200))
+
+# modules that must only be loaded by the functions that need them
+LAZY = {
+    "resources.utils": ["subprocess", "getpass", "concurrent.futures"],
+    "resources.smk_utils": ["pandas", "numpy", "subprocess"],
+    "resources.add_links_to_readmes": ["marko", "subprocess", "concurrent.futures"],
+    "resources.add_subfolders_to_readmes": ["subprocess", "concurrent.futures"],
+}
+
+def run_python(code, importtime=False):
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONPATH"}
+    return subprocess.run(cmd, cwd=USER_DIR, env=env, capture_output=True, text=True, check=True)
+
+def loaded(modules, stmt="pass"):
+    """Which of `modules` are in sys.modules after running `stmt`."""
+    out = run_python(f"import sys\n{stmt}\nimport json\n"
+                     f"print(json.dumps([m for m in {modules!r} if m in sys.modules]))")
+    return set(json.loads(out.stdout))
+
+@pytest.mark.parametrize("module", sorted(LAZY))
+def test_lazy_imports(module):
+    # ignore modules the interpreter already loads on its own (e.g. from .pth files)
+    at_startup = loaded(LAZY[module])
+    assert loaded(LAZY[module], f"import {module}") - at_startup == set()
+
+@pytest.mark.parametrize("module", sorted(LAZY))
+def test_import_time_budget(module):
+    stderr = run_python(f"import {module}", importtime=True).stderr
+    # import time:  self [us] | cumulative | imported package
+    cumulative = {line.split("|")[2].strip(): int(line.split("|")[1])
+                  for line in stderr.splitlines() if line.startswith("import time:") and "|" in line
+                  and not line.split("|")[1].strip().startswith("cumulative")}
+    assert cumulative[module] / 1000 < BUDGET_MS, f"{module}: {cumulative[module] / 1000:.1f} ms"
@@ -1,3 +1,4 @@
+import os
 import sys
 from pathlib import Path
 import pytest
@@ -98,3 +99,181 @@ def test_load_config_defaults(tmp_path, monkeypatch):
 
     out = utils.load_config(username="junior")
     assert out["file"] == "/test/junior/data/myfile"
+
+############# tests for the load_config / load_paths cache
+@pytest.fixture
+def config_files(tmp_path):
+    """config.yml + resources.yml on disk, with an empty cache."""
+    config_file = tmp_path / "config.yml"
+    resources_file = tmp_path / "resources.yml"
+    with config_file.open("w") as f:
+        yaml.dump({"file": "./{proj_data_dir}/myfile", "files": ["./{proj_data_dir}/a"]}, f)
+    with resources_file.open("w") as f:
+        yaml.dump({"path_map": {"alice": {"proj_data_dir": "/test/data"}}}, f)
+    utils.clear_cache()
+    yield config_file, resources_file
+    utils.clear_cache()
+
+def test_load_config_cache_hit(config_files):
+    config_file, resources_file = config_files
+    out1 = utils.load_config(config=config_file, resources=resources_file, username="alice")
+    out2 = utils.load_config(config=config_file, resources=resources_file, username="alice")
+    assert out1 is out2
+    stats = utils.cache_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] >= 1
+
+def test_load_config_cache_is_read_only(config_files):
+    config_file, resources_file = config_files
+    out = utils.load_config(config=config_file, resources=resources_file, username="alice")
+    assert out["file"] == "/test/data/myfile"
+    assert out["files"] == ("/test/data/a",)
+    with pytest.raises(TypeError):
+        out["file"] = "changed"
+
+def test_load_config_cache_invalidated_on_change(config_files):
+    config_file, resources_file = config_files
+    utils.load_config(config=config_file, resources=resources_file, username="alice")
+
+    with resources_file.open("w") as f:
+        yaml.dump({"path_map": {"alice": {"proj_data_dir": "/test/other_data"}}}, f)
+
+    out = utils.load_config(config=config_file, resources=resources_file, username="alice")
+    assert out["file"] == "/test/other_data/myfile"
+    assert utils.cache_stats()["invalidations"] >= 1
+
+def test_load_config_cache_keyed_on_user(config_files):
+    config_file, resources_file = config_files
+    with resources_file.open("w") as f:
+        yaml.dump({"path_map": {"alice": {"proj_data_dir": "/test/data"},
+                                "mn5_user": {"proj_data_dir": "/gpfs/data"}}}, f)
+    alice = utils.load_config(config=config_file, resources=resources_file, username="alice")
+    mn5 = utils.load_config(config=config_file, resources=resources_file, mn5_user=True)
+    assert alice["file"] == "/test/data/myfile"
+    assert mn5["file"] == "/gpfs/data/myfile"
+
+def test_load_config_no_cache(config_files):
+    config_file, resources_file = config_files
+    out1 = utils.load_config(config=config_file, resources=resources_file, username="alice", cache=False)
+    out2 = utils.load_config(config=config_file, resources=resources_file, username="alice", cache=False)
+    assert out1 == out2
+    assert out1 is not out2
+    assert isinstance(out1, dict)
+    assert utils.cache_stats()["size"] == 0
+
+def test_clear_cache(config_files):
+    config_file, resources_file = config_files
+    utils.load_paths(resources=str(resources_file), username="alice")
+    assert utils.cache_stats()["size"] == 1
+    utils.clear_cache()
+    assert utils.cache_stats() == {"hits": 0, "misses": 0, "invalidations": 0, "size": 0}
+
+############# tests for load_config(lazy=True)
+def test_lazy_config_matches_eager(fake_resources):
+    config_dict = {"file": "./{proj_data_dir}/myfile",
+                   "nested": {"ref": "./{proj_ref_dir}/ref.fa", "n": 3},
+                   "files": ["./{proj_data_dir}/a", "./{proj_data_dir}/b"]}
+    eager = utils.load_config(config=config_dict, resources=fake_resources, username="alice")
+    lazy = utils.load_config(config=config_dict, resources=fake_resources, username="alice", lazy=True)
+
+    assert isinstance(lazy, utils.LazyConfig)
+    assert lazy["file"] == eager["file"]
+    assert lazy["nested"]["ref"] == eager["nested"]["ref"]
+    assert lazy["files"] == tuple(eager["files"])
+    assert lazy.to_dict() == eager
+    assert set(lazy) == set(eager)
+    assert lazy.get("missing") is None
+
+def test_lazy_config_resolves_on_access(fake_resources, monkeypatch):
+    config_dict = {"a": "./{proj_data_dir}/a", "b": "./{proj_data_dir}/b"}
+    lazy = utils.load_config(config=config_dict, resources=fake_resources, username="alice", lazy=True)
+
+    calls = []
+    resolve = utils.resolve_config_symlinks
+    monkeypatch.setattr(utils, "resolve_config_symlinks", lambda d: calls.append(d) or resolve(d))
+
+    assert lazy["a"] == "/test/data/a"
+    assert lazy["a"] == "/test/data/a"  # cached
+    assert calls == ["/test/data/a"]
+
+def test_lazy_config_read_only(fake_resources):
+    lazy = utils.load_config(config={"a": ["./{proj_data_dir}/a"]},
+                             resources=fake_resources, username="alice", lazy=True)
+    with pytest.raises(TypeError):
+        lazy["a"] = "x"
+    with pytest.raises(AttributeError):
+        lazy["a"].append("x")
+
+def test_lazy_config_cached(config_files):
+    config_file, resources_file = config_files
+    out1 = utils.load_config(config=config_file, resources=resources_file, username="alice", lazy=True)
+    out2 = utils.load_config(config=config_file, resources=resources_file, username="alice", lazy=True)
+    assert out1 is out2
+    assert out1["file"] == "/test/data/myfile"
+
+############# tests for the binary config snapshots
+def test_snapshot_written_and_reused(config_files, monkeypatch):
+    config_file, resources_file = config_files
+    out = utils.load_config(config=config_file, resources=resources_file, username="alice")
+    snapshot_file = utils.config_snapshot_file(config_file, "alice")
+    assert snapshot_file.exists()
+
+    # a new process (empty cache) should not need to parse the YAML again
+    utils.clear_cache()
+    def fail(*args, **kwargs):
+        raise AssertionError("YAML should not be parsed")
+    monkeypatch.setattr(utils, "load_yml", fail)
+    assert utils.load_config(config=config_file, resources=resources_file, username="alice") == out
+
+def test_snapshot_rebuilt_when_stale(config_files):
+    config_file, resources_file = config_files
+    utils.load_config(config=config_file, resources=resources_file, username="alice")
+
+    with resources_file.open("w") as f:
+        yaml.dump({"path_map": {"alice": {"proj_data_dir": "/test/other_data"}}}, f)
+    utils.clear_cache()
+
+    out = utils.load_config(config=config_file, resources=resources_file, username="alice")
+    assert out["file"] == "/test/other_data/myfile"
+
+def test_snapshot_corrupt(config_files):
+    config_file, resources_file = config_files
+    snapshot_file = utils.config_snapshot_file(config_file, "alice")
+    snapshot_file.parent.mkdir()
+    snapshot_file.write_bytes(b"not a pickle")
+
+    out = utils.load_config(config=config_file, resources=resources_file, username="alice")
+    assert out["file"] == "/test/data/myfile"
+
+def test_snapshot_relative_paths_keyed_on_cwd(config_files, tmp_path, monkeypatch):
+    config_file, resources_file = config_files
+    with config_file.open("w") as f:
+        yaml.dump({"rel": "some/relative/path"}, f)
+
+    monkeypatch.chdir(tmp_path)
+    utils.load_config(config=config_file, resources=resources_file, username="alice", cache=False)
+
+    other = tmp_path / "other"
+    other.mkdir()
+    monkeypatch.chdir(other)
+    out = utils.load_config(config=config_file, resources=resources_file, username="alice", cache=False)
+    assert out["rel"] == str(other.resolve() / "some/relative/path")
+
+def test_save_config_snapshots(config_files):
+    config_file, resources_file = config_files
+    with resources_file.open("w") as f:
+        yaml.dump({"path_map": {"alice": {"proj_data_dir": "/test/data"},
+                                "bob": {"proj_data_dir": "/test/bob"}}}, f)
+    files = utils.save_config_snapshots(config=config_file, resources=resources_file)
+    assert sorted(f.name for f in files) == ["alice.pkl", "bob.pkl"]
+
+def test_snapshot_tmp_names_unique(tmp_path):
+    file = tmp_path / "alice.pkl"
+    names = {utils._tmp_name(file) for _ in range(100)}
+    assert len(names) == 100
+    assert all(n.parent == tmp_path and os.uname().nodename in n.name for n in names)
+
+def test_snapshot_failed_write_leaves_no_tmp(tmp_path):
+    with pytest.raises(Exception):
+        utils._write_snapshot({"config": lambda: None}, tmp_path / "alice.pkl")
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,174 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from template_user.resources import utils
+
+@pytest.fixture
+def metrics(monkeypatch):
+    """The module-level metrics, enabled and empty."""
+    monkeypatch.setattr(utils.metrics, "enabled", True)
+    utils.metrics.clear()
+    yield utils.metrics
+    utils.metrics.clear()
+
+@pytest.fixture
+def yml_file(tmp_path):
+    f = tmp_path / "x.yml"
+    f.write_text(yaml.dump({"a": 1, "b": [1, 2, 3]}))
+    return f
+
+def test_disabled_records_nothing(yml_file):
+    utils.metrics.clear()
+    assert not utils.metrics.enabled
+    utils.load_yml(yml_file)
+    utils.dump_yml({"a": 1})
+    with utils.metrics.step("block"):
+        pass
+    assert utils.metrics.to_dict() == {"steps": {}, "commands": {}}
+
+def test_yaml_calls_and_bytes(metrics, yml_file, tmp_path):
+    assert utils.load_yml(yml_file) == {"a": 1, "b": [1, 2, 3]}
+    utils.load_yml(yml_file)
+    text = utils.dump_yml({"a": 1})
+    with open(tmp_path / "out.yml", "w") as f:
+        f.write("# header\n")
+        utils.dump_yml({"b": [1, 2]}, f)
+
+    steps = metrics.to_dict()["steps"]
+    assert steps["load_yml"]["calls"] == 2
+    assert steps["load_yml"]["bytes_read"] == 2 * yml_file.stat().st_size
+    assert steps["dump_yml"]["calls"] == 2
+    assert steps["dump_yml"]["bytes_written"] == (
+        len(text) + (tmp_path / "out.yml").stat().st_size - len("# header\n"))
+    assert steps["load_yml"]["seconds"] > 0
+
+def test_recursive_step_counted_once(metrics):
+    @metrics.timed("fib")
+    def fib(n):
+        return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+    assert fib(10) == 55
+    with metrics.step("fib"):
+        fib(3)
+    assert metrics.to_dict()["steps"]["fib"]["calls"] == 2
+
+def test_load_config_counted_once(metrics, tmp_path):
+    config, resources = tmp_path / "config.yml", tmp_path / "resources.yml"
+    config.write_text(yaml.dump({"data": "{data_dir}/x"}))
+    resources.write_text(yaml.dump({"path_map": {"alice": {"data_dir": str(tmp_path)}}}))
+    utils.clear_cache()
+    utils.load_config(config, resources, username="alice", snapshot=False)
+    assert metrics.to_dict()["steps"]["load_config"]["calls"] == 1
+
+def test_run_cmd_records_subprocess(metrics, tmp_path):
+    utils.run_cmd("git --version")
+    with pytest.raises(subprocess.CalledProcessError):
+        utils.run_cmd(["git", "not-a-command"], wd=tmp_path)
+    utils.run_cmd("echo hi | cat", shell=True)
+
+    data = metrics.to_dict()
+    assert data["steps"]["run_cmd"]["calls"] == 3
+    assert data["commands"]["git"]["calls"] == 2
+    assert data["commands"]["git"]["failures"] == 1
+    assert data["commands"]["echo"]["failures"] == 0
+
+def test_copy_tree_bytes(metrics, tmp_path):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "a.txt").write_text("a" * 100)
+    (src / "sub" / "b.txt").write_text("b" * 50)
+    utils.copy_tree(src, tmp_path / "dst", dry_run=False)
+
+    step = metrics.to_dict()["steps"]["copy_tree"]
+    assert step["calls"] == 1
+    assert step["bytes_read"] == step["bytes_written"] == 150
+
+def test_threaded_counts(metrics):
+    @metrics.timed("work")
+    def work(i):
+        metrics.add_bytes("work", read=i)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(work, range(1000)))
+    step = metrics.to_dict()["steps"]["work"]
+    assert step["calls"] == 1000
+    assert step["bytes_read"] == sum(range(1000))
+
+def test_prometheus_format(metrics):
+    with metrics.step('write "x"\n'):
+        pass
+    metrics.add_bytes("load_yml", read=10)
+    with metrics.command("git status"):
+        pass
+
+    text = metrics.to_prometheus()
+    assert text.endswith("\n")
+    assert "# TYPE proj_calls_total counter" in text
+    assert 'proj_calls_total{step="write \\"x\\"\\n"} 1' in text
+    assert 'proj_read_bytes_total{step="load_yml"} 10' in text
+    assert 'proj_subprocess_calls_total{command="git"} 1' in text
+    # every sample line is `name{label="value"} number`
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            float(value)
+            assert name.startswith("proj_") and name.endswith('"}')
+
+def test_write_by_suffix(metrics, tmp_path):
+    with metrics.step("x"):
+        pass
+    metrics.write(tmp_path / "m.json")
+    metrics.write(tmp_path / "out" / "m.prom")
+    assert json.loads((tmp_path / "m.json").read_text())["steps"]["x"]["calls"] == 1
+    assert (tmp_path / "out" / "m.prom").read_text() == metrics.to_prometheus()
+
+def test_env_writes_at_exit(tmp_path, yml_file):
+    out = tmp_path / "metrics.prom"
+    root = Path(utils.__file__).parents[2]
+    env = dict(os.environ, PROJ_METRICS=str(out), PYTHONPATH=str(root))
+    code = f"from template_user.resources import utils; utils.load_yml({str(yml_file)!r})"
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    assert 'proj_calls_total{step="load_yml"} 1' in out.read_text()
+
+def test_prometheus_roundtrip(metrics):
+    with metrics.step('write "x"\n'):
+        pass
+    metrics.add_bytes("load_yml", read=10)
+    with metrics.command("git status"):
+        pass
+    data = metrics.to_dict()
+    assert utils.Metrics.parse_prometheus(metrics.to_prometheus()) == data
+    with pytest.raises(ValueError):
+        utils.Metrics.parse_prometheus("not a sample 1")
+
+@pytest.mark.parametrize("name", ["metrics.json", "metrics.prom"])
+def test_env_processes_add_up(tmp_path, yml_file, name):
+    # e.g. the jobs of a pipeline exiting at the same time
+    out = tmp_path / name
+    root = Path(utils.__file__).parents[2]
+    env = dict(os.environ, PROJ_METRICS=str(out), PYTHONPATH=str(root))
+    code = f"from template_user.resources import utils; utils.load_yml({str(yml_file)!r})"
+    procs = [subprocess.Popen([sys.executable, "-c", code], env=env) for _ in range(8)]
+    assert all(p.wait() == 0 for p in procs)
+
+    text = out.read_text()
+    data = utils.Metrics.parse_prometheus(text) if name.endswith(".prom") else json.loads(text)
+    assert data["steps"]["load_yml"]["calls"] == 8
+    assert data["steps"]["load_yml"]["bytes_read"] == 8 * yml_file.stat().st_size
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([name, f"{name}.lock", "x.yml"])
+
+def test_write_merge_replaces_unreadable(metrics, tmp_path, capsys):
+    out = tmp_path / "m.json"
+    out.write_text("{truncated")
+    with metrics.step("x"):
+        pass
+    metrics.write(out, merge=True)
+    metrics.write(out, merge=True)
+    assert json.loads(out.read_text())["steps"]["x"]["calls"] == 2
+    assert "unreadable" in capsys.readouterr().err
@@ -33,7 +33,7 @@ def test_verify_proj_name_called(monkeypatch, tmp_path, fake_resources):
     monkeypatch.setattr(setup_project, "verify_proj_name", lambda name: called.setdefault("called", True))
     monkeypatch.setattr(setup_project, "check_setup_usernames", lambda users: None)
     monkeypatch.setattr(setup_project, "safe_run", lambda cmd, **kwargs: None)
-    monkeypatch.setattr(setup_project, "generate_path_map", lambda s, p: {"dummy": "map"})
+    monkeypatch.setattr(setup_project, "generate_user_index", lambda s, p: ({}, {"dummy": "map"}))
 
     setup_project.main(dry_run=True, resources="fake")
     assert called.get("called")
@@ -43,7 +43,7 @@ def test_dry_run_returns(monkeypatch, tmp_path, fake_resources):
     monkeypatch.setattr(setup_project, "verify_proj_name", lambda name: None)
     monkeypatch.setattr(setup_project, "check_setup_usernames", lambda users: None)
     monkeypatch.setattr(setup_project, "safe_run", lambda cmd, **kwargs: None)
-    monkeypatch.setattr(setup_project, "generate_path_map", lambda s, p: {"dummy": "map"})
+    monkeypatch.setattr(setup_project, "generate_user_index", lambda s, p: ({}, {"dummy": "map"}))
 
     output = setup_project.main(dry_run=True, resources="fake")
     assert output["path_map"] == {"dummy": "map"}
@@ -57,9 +57,23 @@ def test_setup_project_integration_dry_run(monkeypatch, tmp_path, fake_resources
     monkeypatch.setattr(setup_project, "check_setup_usernames", lambda users: None)
 
     monkeypatch.setattr(setup_project, "safe_run", lambda cmd, **kwargs: None)
-    monkeypatch.setattr(setup_project.shutil, "copytree", lambda src, dst: None)
-    monkeypatch.setattr(setup_project, "generate_path_map", lambda s, p: {"dummy": "map"})
+    monkeypatch.setattr(setup_project, "copy_tree", lambda src, dst, **kwargs: None)
+    monkeypatch.setattr(setup_project, "generate_user_index", lambda s, p: ({}, {"dummy": "map"}))
 
     output = setup_project.main(dry_run=True, resources="fake")
     assert output["path_map"] == {"dummy": "map"}
     assert "alice" in output["users"]
+
+def test_dry_run_metrics(monkeypatch, fake_resources):
+    monkeypatch.setattr(setup_project, "load_yml", lambda x: fake_resources)
+    monkeypatch.setattr(setup_project, "verify_proj_name", lambda name: None)
+    monkeypatch.setattr(setup_project, "check_setup_usernames", lambda users: None)
+    monkeypatch.setattr(setup_project, "safe_run", lambda cmd, **kwargs: None)
+    monkeypatch.setattr(setup_project.metrics, "enabled", True)
+    setup_project.metrics.clear()
+
+    setup_project.main(dry_run=True, resources="fake")
+    steps = setup_project.metrics.to_dict()["steps"]
+    setup_project.metrics.clear()
+    assert steps["copy user dir"]["calls"] == 2
+    assert steps["copy_tree"]["calls"] == 2
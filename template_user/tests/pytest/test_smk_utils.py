@@ -0,0 +1,325 @@
+import os
+import shutil
+import subprocess
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from template_user.resources import smk_utils
+from template_user.resources.smk_utils import MetadataIndex, get_value_from_df
+
+@pytest.fixture
+def metadata():
+    return pd.DataFrame({
+        "sample": ["s1", "s1", "s2", "s3", "s3"],
+        "condition": ["ctrl", "ctrl", "treat", "ctrl", "treat"],
+        "rep": [1, 2, 1, 1, 1],
+        "bam": ["s1_1.bam", "s1_2.bam", "s2_1.bam", "s3_1.bam", "s3_1.bam"],
+    })
+
+QUERIES = [
+    ("bam", {"sample": "s2"}),
+    ("bam", {"sample": "s1", "condition": "ctrl", "rep": 2}),
+    ("bam", {"condition": "ctrl", "sample": "s1"}),
+    ("sample", {"condition": "ctrl"}),
+    ("bam", {"sample": "s3"}),
+    ("bam", {"sample": "missing"}),
+    ("bam", {"rep": "1"}),  # wildcards are strings; no match on ints, as before
+    ("sample", {}),
+]
+
+@pytest.mark.parametrize("target, filters", QUERIES)
+def test_index_matches_df(metadata, target, filters):
+    index = MetadataIndex(metadata)
+
+    assert (get_value_from_df(index, target, filters, single_output=False)
+            == get_value_from_df(metadata, target, filters, single_output=False))
+
+    try:
+        expected = get_value_from_df(metadata, target, filters)
+    except AssertionError:
+        with pytest.raises(AssertionError):
+            get_value_from_df(index, target, filters)
+    else:
+        assert get_value_from_df(index, target, filters) == expected
+
+def test_index_single_output(metadata):
+    index = MetadataIndex(metadata)
+    assert index.get("bam", {"sample": "s3"}) == "s3_1.bam"
+    with pytest.raises(AssertionError, match="got 2"):
+        index.get("bam", {"sample": "s1"})
+
+def test_index_groups_once(metadata, monkeypatch):
+    index = MetadataIndex(metadata)
+    index.get("bam", {"sample": "s2"})
+
+    calls = []
+    monkeypatch.setattr(pd.DataFrame, "groupby", lambda *a, **k: calls.append(a))
+    for s in ["s1", "s2", "s3"]:
+        index.get("bam", {"sample": s}, single_output=False)
+    assert calls == []
+
+def test_get_value_from_df_does_not_copy(metadata, monkeypatch):
+    monkeypatch.setattr(pd.DataFrame, "copy", lambda *a, **k: pytest.fail("copied"))
+    assert get_value_from_df(metadata, "bam", {"sample": "s2"}) == "s2_1.bam"
+
+############# get_values_from_df
+
+def test_get_values_matches_per_row(metadata):
+    queries = pd.DataFrame([f for _, f in QUERIES if f and "rep" not in f])
+    queries = queries.fillna("s1")  # one column set for all rows
+    result = smk_utils.get_values_from_df(metadata, "bam", queries, single_output=False)
+
+    for (_, row), values in zip(queries.iterrows(), result["value"]):
+        assert values == get_value_from_df(metadata, "bam", row.to_dict(), single_output=False)
+
+def test_get_values_reports_ambiguous(metadata):
+    queries = pd.DataFrame({"sample": ["s1", "s2", "missing", "s3"]}, index=[10, 11, 12, 13])
+    result = smk_utils.get_values_from_df(MetadataIndex(metadata), "bam", queries)
+
+    assert result.index.tolist() == [10, 11, 12, 13]
+    assert result["value"].tolist() == [None, "s2_1.bam", None, "s3_1.bam"]
+    assert result["n_values"].tolist() == [2, 1, 0, 1]
+    assert result["ambiguous"].tolist() == [True, False, False, False]
+
+def test_get_values_raise_lists_all_rows(metadata):
+    queries = [{"sample": "s1"}, {"sample": "s2"}, {"sample": "missing"}]
+    with pytest.raises(AssertionError, match="2 rows") as e:
+        smk_utils.get_values_from_df(metadata, "bam", queries, errors="raise")
+    assert "missing" in str(e.value) and "s1" in str(e.value)
+
+def test_get_values_ignores_nan_keys():
+    df = pd.DataFrame({"sample": ["a", None], "bam": ["a.bam", "none.bam"]})
+    queries = pd.DataFrame({"sample": ["a", None]})
+    result = smk_utils.get_values_from_df(df, "bam", queries)
+    assert result["value"].tolist() == ["a.bam", None]
+
+def test_get_values_aligns_key_types(metadata):
+    # wildcards are strings; rep is int
+    queries = pd.DataFrame({"sample": ["s1", "s1", "s2"], "rep": ["2", "x", "1"]})
+    result = smk_utils.get_values_from_df(metadata, "bam", queries)
+    assert result["value"].tolist() == ["s1_2.bam", None, "s2_1.bam"]
+    assert result["n_values"].tolist() == [1, 0, 1]
+    assert result["rep"].tolist() == ["2", "x", "1"]
+
+    # and the other way around, with categorical columns
+    df = metadata.astype({"rep": str, "sample": "category"})
+    queries = pd.DataFrame({"sample": ["s1", "s3"], "rep": [2, 1]})
+    result = smk_utils.get_values_from_df(df, "bam", queries)
+    assert result["value"].tolist() == ["s1_2.bam", "s3_1.bam"]
+
+############# load_metadata
+
+@pytest.fixture
+def metadata_file(tmp_path):
+    n = 200
+    df = pd.DataFrame({
+        "sample": [f"s{i}" for i in range(n)],
+        "condition": ["ctrl", "treat"] * (n // 2),
+        "rep": [1, 2, 3, 4] * (n // 4),
+        "notes": ["x"] * n,
+    })
+    file = tmp_path / "metadata.tsv"
+    df.to_csv(file, sep="\t", index=False)
+    return file
+
+def test_load_metadata_usecols_categorical(metadata_file, capsys):
+    df = smk_utils.load_metadata(metadata_file, usecols=["sample", "condition", "rep"])
+
+    assert list(df.columns) == ["sample", "condition", "rep"]
+    assert isinstance(df["condition"].dtype, pd.CategoricalDtype)
+    assert not isinstance(df["sample"].dtype, pd.CategoricalDtype)  # all unique
+    assert df["rep"].dtype.kind == "i"
+    out = capsys.readouterr()
+    assert "1 columns skipped" in out.err
+    assert out.out == ""  # keeps stdout clean, e.g. for snakemake --dag | dot
+
+    # lookups still work on categorical columns
+    assert get_value_from_df(df, "sample", {"condition": "treat", "rep": 4},
+                             single_output=False)[:2] == ["s3", "s7"]
+    assert MetadataIndex(df).get("rep", {"sample": "s5"}) == 2
+
+@pytest.mark.parametrize("fmt", ["parquet", "feather"])
+def test_load_metadata_cache(metadata_file, fmt, monkeypatch):
+    pytest.importorskip("pyarrow")
+    cache_file = f"{metadata_file}.{fmt}"
+
+    df = smk_utils.load_metadata(metadata_file, cache=fmt, verbose=False)
+    assert os.path.exists(cache_file)
+
+    # served from the cache while it is newer than the table
+    monkeypatch.setattr(pd, "read_csv", lambda *a, **k: pytest.fail("read tsv"))
+    cached = smk_utils.load_metadata(metadata_file, usecols=["sample", "condition"],
+                                     cache=fmt, verbose=False)
+    pd.testing.assert_frame_equal(cached, df[["sample", "condition"]])
+    monkeypatch.undo()
+
+    # invalidated when the table changes
+    os.utime(cache_file, (0, 0))
+    pd.read_csv(metadata_file, sep="\t").head(3).to_csv(metadata_file, sep="\t", index=False)
+    assert len(smk_utils.load_metadata(metadata_file, cache=fmt, verbose=False)) == 3
+
+@pytest.mark.parametrize("fmt", ["parquet", "feather"])
+def test_load_metadata_cache_settings(metadata_file, fmt):
+    pytest.importorskip("pyarrow")
+    subset = smk_utils.load_metadata(metadata_file, usecols=["sample", "condition"],
+                                     cache=fmt, verbose=False)
+    assert list(subset.columns) == ["sample", "condition"]
+    assert not subset.attrs
+
+    # a cache of some columns doesn't serve the whole table
+    df = smk_utils.load_metadata(metadata_file, cache=fmt, verbose=False)
+    assert list(df.columns) == ["sample", "condition", "rep", "notes"]
+
+    # nor a table converted with other settings
+    df = smk_utils.load_metadata(metadata_file, cache=fmt, max_unique_frac=0, verbose=False)
+    assert not isinstance(df["condition"].dtype, pd.CategoricalDtype)
+    df = smk_utils.load_metadata(metadata_file, cache=fmt, verbose=False)
+    assert isinstance(df["condition"].dtype, pd.CategoricalDtype)
+
+def test_load_metadata_cache_not_writable(metadata_file, monkeypatch, capsys):
+    pytest.importorskip("pyarrow")
+    def read_only(*args):
+        raise PermissionError("read-only directory")
+    monkeypatch.setattr(smk_utils.os, "replace", read_only)
+    df = smk_utils.load_metadata(metadata_file, cache="parquet")
+    assert len(df) == 200
+    assert "Not caching metadata" in capsys.readouterr().err
+    assert sorted(p.name for p in metadata_file.parent.iterdir()) == ["metadata.tsv"]
+
+def test_load_metadata_bad_cache(metadata_file):
+    with pytest.raises(ValueError):
+        smk_utils.load_metadata(metadata_file, cache="csv")
+
+############# LogLayout
+
+def test_log_layout_sharded_paths(tmp_path):
+    from types import SimpleNamespace
+    layout = smk_utils.LogLayout(log_dir=tmp_path / "logs", shard_width=2)
+
+    path = layout.path("align", SimpleNamespace(sample="s1", rep="2"))
+    shard = layout.shard("align_sample=s1_rep=2")
+    assert path == f"{tmp_path}/logs/align/{shard}/align_sample=s1_rep=2_%j.log"
+    assert layout.path("align", {"sample": "s1", "rep": "2"}) == path
+    assert layout.slurm_log("align")({"sample": "s1"}).endswith("_%j.out")
+
+    unsharded = smk_utils.LogLayout(log_dir="logs", shard_width=0)
+    assert unsharded.path("align", {"sample": "s1"}, job_id="") == "logs/align/align_sample=s1.log"
+
+def test_log_layout_make_dirs_batch(tmp_path, monkeypatch):
+    layout = smk_utils.LogLayout(log_dir=tmp_path, shard_width=1)
+    table = pd.DataFrame({"sample": [f"s{i}" for i in range(500)]})
+    paths = layout.paths("align", table)
+
+    assert len(set(paths)) == 500
+    # at most 16 shards, each created once
+    calls = []
+    makedirs = os.makedirs
+    monkeypatch.setattr(smk_utils.os, "makedirs", lambda d, **k: (calls.append(d), makedirs(d, **k)))
+    created = layout.make_dirs()
+    assert len(created) == 16
+    assert [d for d in calls if d in created] == created
+    assert all(os.path.isdir(os.path.dirname(p)) for p in paths)
+    assert layout.make_dirs() == []
+
+def test_log_layout_slurm_log_creates_nothing(tmp_path, monkeypatch):
+    # evaluated by snakemake -n / --dag too: submit_smk.sh creates the dirs
+    layout = smk_utils.LogLayout(log_dir=tmp_path / "logs", shard_width=1)
+    monkeypatch.setattr(smk_utils.os, "makedirs", lambda d, **k: pytest.fail(f"created {d}"))
+
+    slurm_log = layout.slurm_log("align")
+    paths = [slurm_log({"sample": f"s{i}"}) for i in range(100)]
+    assert len(set(paths)) == 100
+    assert len(layout.dirs) == 16
+
+@pytest.mark.parametrize("mode", ["-n", "--dag"])
+def test_log_layout_snakemake_dry_run_creates_nothing(tmp_path, mode):
+    if not shutil.which("snakemake"):
+        pytest.skip("snakemake is not installed")
+    root = os.path.dirname(os.path.dirname(smk_utils.__file__))
+    (tmp_path / "Snakefile").write_text(f"""
+import sys
+sys.path.insert(0, {root!r})
+from resources.smk_utils import *
+rule all:
+    input: expand("out_{{s}}.txt", s=["a", "b"])
+rule make:
+    output: "out_{{s}}.txt"
+    shell: "touch {{output}}"
+log_layout.add_slurm_logs(workflow.rules)
+""")
+    subprocess.run(["snakemake", mode, "--cores", "1"], cwd=tmp_path, check=True,
+                   capture_output=True)
+    assert not (tmp_path / "smk_logs").exists()
+
+def test_log_layout_add_slurm_logs(tmp_path):
+    from types import SimpleNamespace
+    def rule(name, norun=False, **params):
+        r = SimpleNamespace(name=name, norun=norun, params=SimpleNamespace(**params))
+        r.set_params = lambda **kw: vars(r.params).update(kw)
+        return r
+
+    own = lambda wc: "own.out"
+    rules = [rule("all", norun=True), rule("align", slurm_log=own), rule("sort", threads=2)]
+    layout = smk_utils.LogLayout(log_dir=tmp_path)
+    assert layout.add_slurm_logs(rules) == ["sort"]
+    assert rules[1].params.slurm_log is own
+    assert not hasattr(rules[0].params, "slurm_log")
+    path = rules[2].params.slurm_log({"sample": "s1"})
+    assert path.startswith(f"{tmp_path}/sort/") and not os.path.exists(os.path.dirname(path))
+
+def test_wildcard_log_path():
+    path = smk_utils.wildcard_log_path({"sample": "s1"}, "sort", ext="err")
+    assert path.startswith("smk_logs/sort/") and path.endswith("/sort_sample=s1_%j.err")
+
+############# rule modules
+
+@pytest.fixture
+def rules_dir(tmp_path):
+    modules = {
+        "align.smk": "rule align:\n    shell: 'x'\n\nrule index:\n    input: rules.sort.output\n",
+        "sort.smk": "rule sort:\n    shell: 'x'\n",
+        "qc/fastqc.smk": "rule fastqc:\n    shell: 'x'\n",
+        "qc/multiqc.smk": "use rule fastqc as fq2 with:\n    threads: 2\n\nrule multiqc:\n    shell: 'x'\n",
+        "unused.smk": "checkpoint unused_step:\n    shell: 'x'\n",
+        "notes.txt": "rule not_a_module:\n",
+    }
+    for name, text in modules.items():
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_text(text)
+    return tmp_path
+
+def test_find_rule_modules_recursive_stable(rules_dir):
+    modules = smk_utils.find_rule_modules(rules_dir)
+    rel = [os.path.relpath(m, rules_dir) for m in modules]
+    assert rel == ["align.smk", "qc/fastqc.smk", "qc/multiqc.smk", "sort.smk", "unused.smk"]
+
+def test_find_rule_modules_targets(rules_dir):
+    rel = lambda ms: [os.path.relpath(m, rules_dir) for m in ms]
+
+    # index uses rules.sort; multiqc uses fastqc
+    assert rel(smk_utils.find_rule_modules(rules_dir, targets=["index"])) == ["align.smk", "sort.smk"]
+    assert rel(smk_utils.find_rule_modules(rules_dir, targets=["multi.*"])) == ["qc/fastqc.smk", "qc/multiqc.smk"]
+    assert smk_utils.find_rule_modules(rules_dir, targets=[]) == []
+
+    # file dependencies are not followed: multiqc's module doesn't pull in
+    # a module whose outputs it may read unless that rule is named
+    (rules_dir / "qc" / "trim.smk").write_text("rule trim:\n    output: 'trimmed.fq'\n")
+    assert "qc/trim.smk" not in rel(smk_utils.find_rule_modules(rules_dir, targets=["multiqc"]))
+    assert "qc/trim.smk" in rel(smk_utils.find_rule_modules(rules_dir, targets=["multiqc", "trim"]))
+
+def test_rules_used_in(tmp_path):
+    snakefile = tmp_path / "Snakefile"
+    snakefile.write_text("use rule align as a1 with:\n    threads: 1\n\n"
+                         "rule local:\n    input: rules.sort.output, rules.local.output\n")
+    assert smk_utils.rules_used_in(snakefile) == ["align", "sort"]
+
+def test_module_timings():
+    timings = smk_utils.ModuleTimings()
+    with timings.time("a.smk"):
+        pass
+    with pytest.raises(ValueError):
+        with timings.time("b.smk"):
+            raise ValueError
+    assert set(timings.seconds) == {"a.smk", "b.smk"}
+    assert timings.report().startswith("Included 2 rule modules")
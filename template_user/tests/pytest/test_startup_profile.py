@@ -0,0 +1,100 @@
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+import pytest
+import yaml
+from pathlib import Path
+
+from template_user.resources import utils
+
+RESOURCES_DIR = Path(utils.__file__).parent
+# total cost of the template.py header in a fresh process, in seconds
+BUDGET = float(os.environ.get("PROJ_STARTUP_BUDGET", 2.0))
+
+def header_lines():
+    """The header of resources/template.py."""
+    lines = (RESOURCES_DIR / "template.py").read_text().splitlines()
+    start = next(i for i, l in enumerate(lines) if l.startswith("# HEADER"))
+    end = next(i for i, l in enumerate(lines) if i > start and l.startswith("#---"))
+    return lines[start:end + 1]
+
+@pytest.fixture
+def project(tmp_path):
+    """Minimal user dir the header can run in, for user alice."""
+    (tmp_path / ".here").touch()
+    res = tmp_path / "resources"
+    res.mkdir()
+    shutil.copy(RESOURCES_DIR / "utils.py", res / "utils.py")
+    (res / "__init__.py").touch()
+    with open(res / "config.yml", "w") as f:
+        yaml.dump({"metadata": "./{proj_metadata_dir}/metadata.tsv",
+                   "data": {f"file{i}": f"./{{proj_data_dir}}/sample{i}.bam" for i in range(200)}}, f)
+    with open(res / "resources.yml", "w") as f:
+        yaml.dump({"path_map": {"alice": {"proj_data_dir": str(tmp_path / "data"),
+                                          "proj_metadata_dir": str(tmp_path / "metadata")}}}, f)
+    (tmp_path / "header.py").write_text("\n".join(header_lines()) + "\n")
+    return tmp_path
+
+def run_header(project):
+    env = dict(os.environ, USER="alice", LOGNAME="alice", PROJ_PROFILE_STARTUP="1")
+    env.pop("PYTHONPATH", None)
+    out = subprocess.run([sys.executable, "header.py"], cwd=project, env=env,
+                         capture_output=True, text=True, check=True)
+    phases = dict((name.strip(), float(ms) / 1000) for name, ms in
+                  re.findall(r"^  (\S.*?)\s+([\d.]+) ms$", out.stderr, re.M))
+    return phases
+
+def test_header_profile_phases(project):
+    phases = run_header(project)
+    for phase in ["root discovery", "imports", "yaml parse", "path map",
+                  "substitution", "symlink resolution", "total"]:
+        assert phase in phases
+    assert sum(v for k, v in phases.items() if k != "total") == pytest.approx(phases["total"], abs=2e-3)
+
+def test_header_startup_budget(project):
+    # second run loads the config snapshot written by the first
+    run_header(project)
+    phases = run_header(project)
+    assert phases["total"] < BUDGET, phases
+
+def test_profiler_counts_nested_calls_once():
+    profiler = utils.StartupProfiler(enabled=True)
+
+    @profiler.profile("inner")
+    def inner():
+        time.sleep(0.02)
+
+    @profiler.profile("outer")
+    def outer():
+        time.sleep(0.02)
+        inner()
+
+    start = time.perf_counter()
+    outer()
+    total = time.perf_counter() - start
+    assert profiler.seconds["inner"] >= 0.02
+    assert profiler.seconds["outer"] >= 0.02
+    # outer excludes the time spent in inner
+    assert profiler.seconds["outer"] + profiler.seconds["inner"] <= total
+
+def test_profiler_disabled():
+    profiler = utils.StartupProfiler()
+    wrapped = profiler.profile("phase")(lambda x: x + 1)
+    assert wrapped(1) == 2
+    assert not profiler.seconds
+    assert utils.startup_profiler.enabled or utils.profile_startup() is None
+
+def test_root_discovery_adds_both_sources(monkeypatch):
+    import io
+    profiler = utils.StartupProfiler(enabled=True)
+    # find_project_root, e.g. called by the Snakefile
+    profiler.seconds["root discovery"] = 0.2
+    monkeypatch.setattr(utils, "startup_profiler", profiler)
+
+    # the header's own lookup took 0.1 s before importing utils
+    phases = utils.profile_startup(start=utils._IMPORT_START - 0.1, file=io.StringIO())
+    assert phases["root discovery"] == pytest.approx(0.3)
+    assert phases["other"] < phases["total"] - 0.3
@@ -1,4 +1,5 @@
 import sys
+import subprocess
 from pathlib import Path
 import pytest
 from unittest.mock import patch
@@ -102,6 +103,29 @@ def test_load_yml_missing(tmp_path):
 
     assert "YAML file not found" in str(excinfo.value)
 
+############# tests for the YAML I/O layer
+def test_dump_yml_roundtrip(tmp_path):
+    data = {"path_map": {"alice": {"data_dir": "/a/data"}}, "users": ["alice"]}
+    yaml_file = tmp_path / "test.yml"
+    with yaml_file.open("w") as f:
+        utils.dump_yml(data, f)
+    assert utils.load_yml(yaml_file) == data
+    assert utils.parse_yml(utils.dump_yml(data)) == data
+
+@pytest.mark.skipif(not yaml.__with_libyaml__, reason="PyYAML built without LibYAML")
+@pytest.mark.parametrize("file", [utils.CONFIG_FILE, utils.RESOURCES_FILE])
+def test_yaml_backends_match(file):
+    text = Path(file).read_text()
+    py = utils.parse_yml(text, loader=yaml.SafeLoader)
+    c = utils.parse_yml(text, loader=yaml.CSafeLoader)
+    assert py == c
+
+    # dumps should match too, including a generated path map
+    if 'setup_settings' in py:
+        py['path_map'] = utils.generate_path_map(py['setup_settings'],
+                                                 py['setup_settings']['project_name'])
+    assert utils.dump_yml(py, dumper=yaml.Dumper) == utils.dump_yml(py, dumper=yaml.CDumper)
+
 ############# tests for load_resources
 
 # resources input as a dict
@@ -382,3 +406,375 @@ def test_mn5_user_is_deepcopy(tmp_path):
 
     # bob should be unaffected
     assert result["bob"]["data_dir"] != "CHANGED"
+
+############# replace_str_dict / compile_substitutions
+
+def test_replace_str_dict_nested():
+    data = {'path': './{data_dir}/a.txt',
+            'files': ['./{ref_dir}/b.fa', 3, None],
+            'nested': {'x': './{data_dir}/c'}}
+    m = {'./{data_dir}': '/data', './{ref_dir}': '/ref'}
+    result = utils.replace_str_dict(data, m)
+    assert result == {'path': '/data/a.txt',
+                      'files': ['/ref/b.fa', 3, None],
+                      'nested': {'x': '/data/c'}}
+
+def test_replace_str_dict_longest_key_wins():
+    # result should not depend on the order of the mapping
+    m1 = {'/home/user': '/mnt/user', '/home/user_data': '/mnt/data'}
+    m2 = dict(reversed(list(m1.items())))
+    for m in [m1, m2]:
+        assert utils.replace_str_dict('/home/user_data/x', m) == '/mnt/data/x'
+        assert utils.replace_str_dict('/home/user/x', m) == '/mnt/user/x'
+
+def test_replace_str_dict_single_pass():
+    # replaced text is not substituted again
+    m = {'./{a_dir}': './{b_dir}', './{b_dir}': '/b'}
+    assert utils.replace_str_dict('./{a_dir}/x', m) == './{b_dir}/x'
+
+def test_replace_str_dict_empty_map():
+    assert utils.replace_str_dict({'a': './{data_dir}'}, {}) == {'a': './{data_dir}'}
+
+def test_compile_substitutions_reused():
+    m = {'./{data_dir}': '/data'}
+    sub = utils.compile_substitutions(m)
+    assert sub is utils.compile_substitutions(dict(m))
+    assert utils.replace_str_dict(['./{data_dir}/x'], sub) == ['/data/x']
+
+############# resolve_paths / resolve_config_symlinks
+
+@pytest.fixture
+def linked_tree(tmp_path):
+    """real/ directory with a file, plus symlinks to both."""
+    real = tmp_path / "real"
+    real.mkdir()
+    (real / "file.txt").write_text("x")
+    (tmp_path / "link_dir").symlink_to(real)
+    (real / "link_file.txt").symlink_to(real / "file.txt")
+    return tmp_path
+
+def test_resolve_paths_matches_path_resolve(linked_tree):
+    paths = [str(linked_tree / "link_dir" / "file.txt"),
+             str(linked_tree / "link_dir" / "link_file.txt"),
+             str(linked_tree / "link_dir" / "missing" / "x.bam"),
+             str(linked_tree / "link_dir" / ".." / "real"),
+             str(linked_tree / "link_dir") + "/",
+             "some/relative/path"]
+    result = utils.resolve_paths(paths)
+    for p in paths:
+        assert result[p] == str(Path(p).resolve())
+
+def test_resolve_paths_parallel(linked_tree):
+    paths = [str(linked_tree / "link_dir" / f"d{i}" / "f.txt") for i in range(20)]
+    assert utils.resolve_paths(paths, max_workers=4) == utils.resolve_paths(paths)
+
+def test_resolve_config_symlinks(linked_tree):
+    config = {"a": str(linked_tree / "link_dir" / "file.txt"),
+              "b": [str(linked_tree / "link_dir" / "link_file.txt"), 5],
+              "name": "sample1",
+              "url": "https://example.org/a/b"}
+    result = utils.resolve_config_symlinks(config)
+    assert result == {"a": str(linked_tree / "real" / "file.txt"),
+                      "b": [str(linked_tree / "real" / "file.txt"), 5],
+                      "name": "sample1",
+                      "url": "https://example.org/a/b"}
+
+def test_resolve_config_symlinks_all_strings():
+    result = utils.resolve_config_symlinks({"name": "sample1"}, skip_non_paths=False)
+    assert result["name"] == str(Path("sample1").resolve())
+
+############# generate_user_index / lookup_user
+
+def test_user_index_matches_path_map(fake_resources):
+    settings = fake_resources['setup_settings']
+    index, path_map = utils.generate_user_index(settings, 'kitties_proj')
+    assert path_map == utils.generate_path_map(settings, 'kitties_proj')
+    assert set(index) == set(path_map)
+
+    assert index['bscjuney']['alias'] == 'junior'
+    assert index['bscjuney']['system'] == 'mn5'
+    assert set(index['kiki_username']) == {'alias', 'system', 'digest'}
+    # mn5_user is a copy of the last mn5 user
+    assert path_map['mn5_user'] == path_map['bsckiki']
+    assert path_map['mn5_user'] is not path_map['bsckiki']
+    assert index['mn5_user'] == index['bsckiki']
+
+def test_user_index_incremental(fake_resources, monkeypatch):
+    settings = fake_resources['setup_settings']
+    kiki = settings['users'].pop('kiki')
+    index, path_map = utils.generate_user_index(settings, 'kitties_proj')
+    junior_paths = path_map['junior_username']
+
+    settings['users']['kiki'] = kiki
+    computed = []
+    user_paths = utils._user_paths
+    monkeypatch.setattr(utils, "_user_paths", lambda alias, *a: (computed.append(alias), user_paths(alias, *a))[1])
+    new_index, new_path_map = utils.generate_user_index(settings, 'kitties_proj',
+                                                        index=index, path_map=path_map)
+
+    assert computed == ['kiki', 'kiki']  # local and mn5
+    assert new_path_map['junior_username'] is junior_paths  # reused
+    monkeypatch.undo()
+    assert (new_index, new_path_map) == utils.generate_user_index(settings, 'kitties_proj')
+
+@pytest.mark.parametrize("change", ["projects_dir", "mn5_locs", "project_name"])
+def test_user_index_recomputes_changed_settings(fake_resources, change):
+    settings = fake_resources['setup_settings']
+    proj_name = 'kitties_proj'
+    index, path_map = utils.generate_user_index(settings, proj_name)
+
+    if change == "projects_dir":
+        settings['users']['kiki']['local']['projects_dir'] = '/new'
+    elif change == "mn5_locs":
+        settings['mn5_locs']['projects_dir'] = '/new'
+    else:
+        proj_name = 'new_proj'
+    updated = utils.generate_user_index(settings, proj_name, index=index, path_map=path_map)
+
+    assert updated == utils.generate_user_index(settings, proj_name)
+    assert updated[1] != path_map
+
+def test_user_index_renamed_username(fake_resources):
+    settings = fake_resources['setup_settings']
+    index, path_map = utils.generate_user_index(settings, 'kitties_proj')
+    settings['users']['kiki']['local']['username'] = 'kiki_new'
+    index, path_map = utils.generate_user_index(settings, 'kitties_proj', index=index, path_map=path_map)
+    assert 'kiki_username' not in index and 'kiki_username' not in path_map
+    assert index['kiki_new']['alias'] == 'kiki'
+
+def test_user_index_old_format(fake_resources):
+    # entries written before the digest was stored are recomputed
+    settings = fake_resources['setup_settings']
+    index, path_map = utils.generate_user_index(settings, 'kitties_proj')
+    old = {u: {'alias': e['alias'], 'system': e['system'], 'paths': {}} for u, e in index.items()}
+    stale = {u: {} for u in path_map}
+    assert utils.generate_user_index(settings, 'kitties_proj', index=old, path_map=stale) == (index, path_map)
+
+def test_lookup_user(fake_resources, monkeypatch):
+    settings = fake_resources['setup_settings']
+    index, path_map = utils.generate_user_index(settings, 'kitties_proj')
+    resources = {'user_index': index, 'path_map': path_map}
+    monkeypatch.setattr("getpass.getuser", lambda: 'kiki_username')
+
+    entry = utils.lookup_user(resources=resources)
+    assert (entry['alias'], entry['system']) == ('kiki', 'local')
+    assert entry['paths'] == path_map['kiki_username']
+    assert utils.lookup_user(resources=resources, mn5_user=True)['system'] == 'mn5'
+
+    with pytest.raises(ValueError):
+        utils.lookup_user('nobody', resources=resources)
+    with pytest.raises(ValueError):
+        utils.lookup_user(resources={'path_map': {}})
+
+def test_load_paths_uses_user_index(fake_resources):
+    settings = fake_resources['setup_settings']
+    index, path_map = utils.generate_user_index(settings, 'kitties_proj')
+    resources = {'user_index': index, 'path_map': path_map}
+
+    paths = utils.load_paths(resources=resources, username='kiki_username', cache=False)
+    assert paths.keys() == path_map['kiki_username'].keys()
+
+    # users are looked up in the index
+    del index['kiki_username']
+    with pytest.raises(ValueError, match="not found"):
+        utils.load_paths(resources=resources, username='kiki_username', cache=False)
+    with pytest.raises(ValueError, match="not in the path_map"):
+        utils.load_paths(resources={'user_index': {'x': index['junior_username']}, 'path_map': {}},
+                         username='x', cache=False)
+
+############# copy_tree
+
+@pytest.fixture
+def src_tree(tmp_path):
+    """Small directory tree with a fake git object store and an ignored file."""
+    src = tmp_path / "src"
+    (src / "sub" / "deeper").mkdir(parents=True)
+    (src / "a.txt").write_text("a")
+    (src / "sub" / "b.txt").write_text("bb")
+    (src / "sub" / "deeper" / "c.txt").write_text("ccc")
+    (src / ".git" / "objects" / "ab").mkdir(parents=True)
+    (src / ".git" / "objects" / "ab" / "cdef").write_text("object")
+    (src / ".git" / "HEAD").write_text("ref: refs/heads/main\n")
+    return src
+
+def _tree(d):
+    return {str(p.relative_to(d)): p.read_text() for p in d.rglob("*") if p.is_file()}
+
+def test_copy_tree(src_tree, tmp_path):
+    dst = tmp_path / "dst"
+    stats = utils.copy_tree(src_tree, dst, jobs=4, dry_run=False)
+    assert _tree(dst) == _tree(src_tree)
+    assert stats["files"] == 5
+    assert stats["bytes"] == sum(len(v) for v in _tree(src_tree).values())
+    assert stats["linked"] == 0
+
+def test_copy_tree_dst_exists(src_tree, tmp_path):
+    dst = tmp_path / "dst"
+    dst.mkdir()
+    with pytest.raises(FileExistsError):
+        utils.copy_tree(src_tree, dst, dry_run=False)
+
+def test_copy_tree_dry_run(src_tree, tmp_path):
+    dst = tmp_path / "dst"
+    assert utils.copy_tree(src_tree, dst, dry_run=True) is None
+    assert not dst.exists()
+
+def test_copy_tree_hardlinks_git_objects(src_tree, tmp_path):
+    dst = tmp_path / "dst"
+    stats = utils.copy_tree(src_tree, dst, link="hardlink", dry_run=False)
+    obj = Path(".git/objects/ab/cdef")
+    assert (dst / obj).stat().st_ino == (src_tree / obj).stat().st_ino
+    assert (dst / "a.txt").stat().st_ino != (src_tree / "a.txt").stat().st_ino
+    assert stats["linked"] == 1
+
+def test_copy_tree_reflink_falls_back(src_tree, tmp_path):
+    dst = tmp_path / "dst"
+    utils.copy_tree(src_tree, dst, link="reflink", dry_run=False)
+    assert _tree(dst) == _tree(src_tree)
+
+def test_copy_tree_skip_ignored(src_tree, tmp_path):
+    subprocess.run(["git", "init", "-q"], cwd=src_tree, check=True)
+    (src_tree / ".gitignore").write_text("*.log\nbig/\n")
+    (src_tree / "run.log").write_text("log")
+    (src_tree / "big").mkdir()
+    (src_tree / "big" / "x.bin").write_text("x")
+
+    dst = tmp_path / "dst"
+    stats = utils.copy_tree(src_tree, dst, skip_ignored=True, dry_run=False)
+    assert not (dst / "run.log").exists()
+    assert not (dst / "big").exists()
+    assert (dst / "sub" / "b.txt").exists()
+    assert (dst / ".git" / "HEAD").exists()
+    assert stats["skipped"] == 2
+
+############# run_jobs
+
+@pytest.mark.parametrize("jobs", [None, 4])
+def test_run_jobs_collects_errors(jobs):
+    done = []
+    def fn(i):
+        if i % 3 == 0:
+            raise ValueError(f"bad {i}")
+        done.append(i)
+
+    errors = utils.run_jobs(fn, range(10), jobs=jobs)
+    assert list(errors) == [0, 3, 6, 9]
+    assert sorted(done) == [1, 2, 4, 5, 7, 8]
+
+    report = utils.format_job_errors(errors, "process items")
+    assert report.splitlines()[0] == "Failed to process items for 4 item(s):"
+    assert "- 3: ValueError: bad 3" in report
+
+############# PathIndex
+
+@pytest.fixture
+def path_index():
+    files = ['README.md', 'analysis/README.md', 'analysis/x.py',
+             'analysis/sub/a.txt', 'resources/utils.py']
+    dirs = ['analysis', 'analysis/sub', 'resources']
+    return utils.PathIndex(files, dirs)
+
+@pytest.mark.parametrize("path,start,expected", [
+    ('x.py', 'analysis', 'analysis/x.py'),
+    ('analysis/x.py', '.', 'analysis/x.py'),
+    ('../resources/utils.py', 'analysis', 'resources/utils.py'),
+    ('../utils.py', 'analysis/sub', None),
+    ('../../resources/utils.py', 'analysis/sub', 'resources/utils.py'),
+    ('sub', 'analysis', 'analysis/sub'),
+    ('sub/', 'analysis', 'analysis/sub'),
+    ('x.py/', 'analysis', None),          # not a directory
+    ('./x.py', 'analysis', None),         # not the canonical spelling
+    ('../analysis/x.py', 'analysis', None),
+    ('..', 'analysis', None),
+    ('/abs/path', '.', None),
+    ('missing.py', 'analysis', None),
+])
+def test_path_index_lookup(path_index, path, start, expected):
+    assert path_index.lookup(path, start) == expected
+
+def test_path_index_matches_relpath(path_index):
+    # same matches as comparing against os.path.relpath of every path
+    import os
+    starts = ['.', 'analysis', 'analysis/sub', 'resources']
+    for start in starts:
+        rel = {os.path.relpath(p, start) for p in path_index.paths}
+        for r in rel:
+            assert path_index.lookup(r, start) is not None
+
+def test_path_index_is_dir(path_index):
+    assert path_index.is_dir('analysis/sub')
+    assert not path_index.is_dir('analysis/x.py')
+
+############# repo_snapshot
+
+def test_repo_snapshot(tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "a" / "b" / "x.py").write_text("")
+    (tmp_path / "top.md").write_text("")
+    (tmp_path / "skip.json").write_text("")
+    (tmp_path / "untracked").mkdir()
+    (tmp_path / "untracked" / "y.py").write_text("")
+    run = lambda cmd: subprocess.run(cmd, cwd=tmp_path, shell=True, check=True)
+    run("git init -q && git add a top.md skip.json")
+    # submodule entry (gitlink)
+    run("git update-index --add --cacheinfo 160000,"
+        "0123456789abcdef0123456789abcdef01234567,sub")
+
+    index = utils.repo_snapshot(tmp_path, exclude=["skip.json"])
+
+    assert index.files == {"a/b/x.py", "top.md"}
+    assert index.dirs == {"a", "a/b", "sub"}
+    assert index.lookup("b/", start="a") == "a/b"
+
+def test_repo_snapshot_no_stat(tmp_path, monkeypatch):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "x.py").write_text("")
+    subprocess.run("git init -q && git add a", cwd=tmp_path, shell=True, check=True)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("stat call")
+    monkeypatch.setattr(utils.os.path, "isdir", fail)
+    monkeypatch.setattr(utils.Path, "is_dir", fail)
+
+    assert utils.repo_snapshot(tmp_path).dirs == {"a"}
+
+############# find_project_root
+
+@pytest.fixture
+def no_root_cache(monkeypatch):
+    monkeypatch.setattr(utils, "_PROJECT_ROOT", None)
+    monkeypatch.delenv(utils.PROJECT_ROOT_ENV, raising=False)
+
+def test_find_project_root_from_module(no_root_cache):
+    # template_user/.here sits next to resources/
+    root = utils.find_project_root()
+    assert root == Path(utils.__file__).resolve().parents[1]
+    assert utils.os.environ[utils.PROJECT_ROOT_ENV] == str(root)
+
+def test_find_project_root_cached(no_root_cache, monkeypatch):
+    first = utils.find_project_root()
+    monkeypatch.setattr(utils.Path, "exists", lambda self: pytest.fail("stat call"))
+    assert utils.find_project_root() is first
+
+def test_find_project_root_env(no_root_cache, monkeypatch, tmp_path):
+    (tmp_path / ".here").touch()
+    monkeypatch.setenv(utils.PROJECT_ROOT_ENV, str(tmp_path))
+    assert utils.find_project_root() == tmp_path
+
+def test_find_project_root_stale_env(no_root_cache, monkeypatch, tmp_path):
+    # e.g. inherited from another project; ignored and overwritten
+    monkeypatch.setenv(utils.PROJECT_ROOT_ENV, str(tmp_path / "nonexistent"))
+    root = utils.find_project_root()
+    assert root == Path(utils.__file__).resolve().parents[1]
+    assert utils.os.environ[utils.PROJECT_ROOT_ENV] == str(root)
+
+def test_find_project_root_start(tmp_path):
+    (tmp_path / ".here").touch()
+    (tmp_path / "analysis" / "task").mkdir(parents=True)
+    assert utils.find_project_root(tmp_path / "analysis" / "task") == tmp_path
+
+    other = tmp_path / "elsewhere"
+    other.mkdir()
+    (tmp_path / ".here").unlink()
+    with pytest.raises(FileNotFoundError):
+        utils.find_project_root(other)